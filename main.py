@@ -79,6 +79,7 @@ except ImportError as e:
 src_path = Path(__file__).parent / 'src'
 sys.path.insert(0, str(src_path))
 
+import multiprocessing
 import tkinter as tk
 from src.gui import MemeFinderGUI
 
@@ -91,4 +92,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包环境中多进程OCR的子进程需要
+    multiprocessing.freeze_support()
     main()
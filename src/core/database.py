@@ -10,11 +10,18 @@
 
 import sqlite3
 from datetime import datetime
-from typing import List, Dict, Set, Any, Optional, Tuple
+from typing import List, Dict, Set, Any, Optional, Tuple, Iterable, Iterator, Callable
 from pathlib import Path
+from collections import namedtuple
 from contextlib import contextmanager
+from concurrent.futures import Future
+import os
+import queue
+import socket
 import threading
+import time
 import sys
+import uuid
 
 # 添加日志支持
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -22,45 +29,124 @@ from utils.logger import get_logger
 
 logger = get_logger()
 
+# 流式查询返回的轻量行记录（namedtuple 无实例字典，内存占用远小于 dict）
+ImageRow = namedtuple('ImageRow', 'id file_path text emotion pos_score neg_score processed added_time')
+PendingImage = namedtuple('PendingImage', 'id file_path source_id phash')
+
+# 短关键词索引的最大长度（更长的关键词使用 trigram 全文索引）
+SHORT_KEYWORD_MAX = 2
+
+
+def split_chars(text: Optional[str]) -> Optional[str]:
+    """把文本拆成以空格分隔的单个字符，写入单字索引 images_chars
+    
+    unicode61 分词器把每个字符作为一个词，短语查询 "你 好" 即匹配相邻的字符。
+    标点和空白替换为占位词 "_"（分词器会丢弃标点，不替换的话 "你。好" 会匹配 "你好"）。
+    由写连接注册为 SQL 函数，供 images_chars 的触发器调用。
+    """
+    return ' '.join(c if c.isalnum() else '_' for c in text) if text else text
+
+
+class _RecordingCursor:
+    """记录执行过的查询及参数的游标（用于检查查询计划）"""
+    
+    def __init__(self, cursor: sqlite3.Cursor, log: List[Tuple[str, Any]]):
+        self._cursor = cursor
+        self._log = log
+    
+    def execute(self, sql: str, params=()):
+        self._log.append((sql, params))
+        return self._cursor.execute(sql, params)
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
 
 class DatabaseConnectionPool:
-    """SQLite连接池 - 线程安全"""
+    """SQLite只读连接池 - 线程安全、有上限
+    
+    连接以只读方式打开（mode=ro + query_only），写操作只能通过 DatabaseWriter。
+    WAL 模式下读连接不会被写事务阻塞，搜索不会排在 OCR 结果的批量写入之后。
+    同一线程嵌套借出时复用同一连接，避免嵌套查询占满连接池而死锁。
+    """
     
-    def __init__(self, db_path: str, pool_size: int = 5):
+    def __init__(self, db_path: str, pool_size: int = 5, timeout: float = 30.0):
         self.db_path = db_path
         self.pool_size = pool_size
-        self._pool = []
+        self.timeout = timeout
+        self._pool: List[sqlite3.Connection] = []
+        self._created = 0
+        self._closed = False
         self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
         self._local = threading.local()
         
+        # 统计
+        self.checkouts = 0
+        self.active = 0
+        self.high_water = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        
         logger.debug(f"初始化数据库连接池: {db_path} (大小: {pool_size})")
     
-    def get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        # 使用线程本地存储，避免跨线程使用连接
-        if hasattr(self._local, 'conn') and self._local.conn:
-            return self._local.conn
-        
-        with self._lock:
-            if self._pool:
-                conn = self._pool.pop()
-                self._local.conn = conn
-                return conn
-        
-        # 创建新连接
-        conn = sqlite3.connect(
-            self.db_path,
-            check_same_thread=False,
-            timeout=30.0  # 30秒超时
-        )
-        # 优化SQLite性能
-        conn.execute("PRAGMA journal_mode=WAL")  # Write-Ahead Logging
-        conn.execute("PRAGMA synchronous=NORMAL")  # 平衡安全和性能
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"{Path(self.db_path).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30.0)
+        conn.execute("PRAGMA query_only=1")
         conn.execute("PRAGMA cache_size=-64000")  # 64MB缓存
         conn.execute("PRAGMA temp_store=MEMORY")  # 内存存储临时表
+        logger.debug("创建新数据库只读连接")
+        return conn
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """借出连接（连接全部在用时等待，超时抛出 TimeoutError）"""
+        # 同一线程嵌套借出时复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            return conn
+        
+        start = time.monotonic()
+        create = False
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("数据库连接池已关闭")
+                if self._pool:
+                    conn = self._pool.pop()
+                    break
+                if self._created < self.pool_size:
+                    self._created += 1
+                    create = True
+                    break
+                remaining = start + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待数据库连接超时 ({self.timeout}秒)")
+                self._available.wait(remaining)
+            
+            waited = time.monotonic() - start
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.active += 1
+            self.high_water = max(self.high_water, self.active)
+        
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._available:
+                    self._created -= 1
+                    self.active -= 1
+                    self._available.notify()
+                raise
         
         self._local.conn = conn
-        logger.debug("创建新数据库连接")
+        self._local.depth = 1
         return conn
     
     def return_connection(self, conn: sqlite3.Connection):
@@ -68,55 +154,276 @@ class DatabaseConnectionPool:
         if not conn:
             return
         
-        with self._lock:
-            if len(self._pool) < self.pool_size:
-                self._pool.append(conn)
-            else:
-                conn.close()
-                logger.debug("连接池已满，关闭连接")
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.conn = None
         
-        if hasattr(self._local, 'conn'):
-            self._local.conn = None
+        with self._available:
+            self.active -= 1
+            if self._closed:
+                conn.close()
+                self._created -= 1
+            else:
+                self._pool.append(conn)
+                self._available.notify()
     
-    def close_all(self):
-        """关闭所有连接"""
+    def metrics(self) -> Dict[str, Any]:
+        """连接池统计：借出次数、等待时间、在用连接数及峰值"""
         with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'connections': self._created,
+                'active': self.active,
+                'high_water': self.high_water,
+                'checkouts': self.checkouts,
+                'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+    
+    def close_all(self):
+        """关闭所有空闲连接（在用连接归还时关闭）"""
+        with self._available:
+            self._closed = True
             for conn in self._pool:
                 conn.close()
+            self._created -= len(self._pool)
             self._pool.clear()
+            self._available.notify_all()
             logger.info("已关闭所有数据库连接")
 
 
+class DatabaseWriter:
+    """单写线程 - 独占唯一的写连接，按组提交所有写操作
+    
+    写操作以函数 func(cursor) 的形式排队，由写线程依次执行。队列中已有的操作
+    （最多 max_batch 个，等待不超过 max_delay 秒）在同一个事务中执行并一次提交，
+    每次提交只需一次 WAL 同步。每个操作使用独立的保存点，单个操作失败不影响同组其他操作。
+    提交的操作中有会改变查询结果的（invalidate=True）时才调用 on_commit。
+    """
+    
+    def __init__(self, db_path: str, max_batch: int = 256, max_delay: float = 0.005,
+                 on_commit: Callable[[], None] = None):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_commit = on_commit
+        
+        # 统计
+        self.commits = 0
+        self.operations = 0
+        
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer")
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def submit(self, func: Callable[[sqlite3.Cursor], Any], transaction: bool = True,
+               invalidate: bool = True) -> Future:
+        """提交写操作
+        
+        Args:
+            func: func(cursor)，在写线程中执行，返回值作为 Future 的结果
+            transaction: False 表示需要在事务之外单独执行（如 VACUUM）
+            invalidate: False 表示不改变查询结果（如领取租约、续约），提交后不触发 on_commit
+        
+        Returns:
+            Future，提交成功后完成
+        """
+        future = Future()
+        self._queue.put((func, future, transaction, invalidate))
+        return future
+    
+    def flush(self):
+        """等待此前提交的写操作全部提交"""
+        self.submit(lambda cursor: None, invalidate=False).result()
+    
+    def close(self):
+        """提交剩余的写操作并停止写线程"""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _connect(self) -> sqlite3.Connection:
+        # 自动提交模式，由写线程自行控制事务
+        conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        # 新数据库启用增量空间回收；旧数据库在下一次完整 VACUUM 后生效
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # 单字索引的触发器调用（只有写连接会修改 images）
+        conn.create_function("split_chars", 1, split_chars, deterministic=True)
+        return conn
+    
+    def _run(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            # 收集一组：队列中已有的操作，最多等待 max_delay 秒
+            batch = []
+            deadline = time.monotonic() + self.max_delay
+            while item is not None:
+                if not item[2]:
+                    # 非事务操作单独执行
+                    if batch:
+                        self._commit_batch(conn, batch)
+                        batch = []
+                    self._run_single(conn, item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+            
+            if batch:
+                self._commit_batch(conn, batch)
+        conn.close()
+    
+    def _run_single(self, conn: sqlite3.Connection, item):
+        func, future, _, invalidate = item
+        if not future.set_running_or_notify_cancel():
+            return
+        cursor = conn.cursor()
+        try:
+            result = func(cursor)
+        except Exception as e:
+            logger.error(f"数据库操作失败: {e}")
+            future.set_exception(e)
+        else:
+            self._committed(1, invalidate)
+            future.set_result(result)
+        finally:
+            cursor.close()
+    
+    def _commit_batch(self, conn: sqlite3.Connection, batch):
+        cursor = conn.cursor()
+        outcomes = []
+        invalidate = False
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for func, future, _, op_invalidate in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                invalidate = invalidate or op_invalidate
+                cursor.execute("SAVEPOINT op")
+                try:
+                    outcomes.append((future, func(cursor), None))
+                    cursor.execute("RELEASE op")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO op")
+                    cursor.execute("RELEASE op")
+                    if not isinstance(e, sqlite3.IntegrityError):
+                        logger.error(f"数据库操作失败: {e}")
+                    outcomes.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"数据库提交失败: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            cursor.close()
+        
+        self._committed(len(outcomes), invalidate)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+    
+    def _committed(self, operations: int, invalidate: bool):
+        self.commits += 1
+        self.operations += operations
+        if invalidate and self.on_commit:
+            self.on_commit()
+
+
 class ImageDatabase:
     """图片数据库管理（优化版）"""
     
+    # 页锚点：跳页时每隔多少页记录一个锚点
+    PAGE_ANCHOR_STRIDE = 10
+    # 查询缓存最多缓存多少组过滤条件
+    QUERY_CACHE_SIZE = 32
+    # 处理任务租约默认时长（秒），超时未续约的图片可被其他处理者重新领取
+    LEASE_SECONDS = 300
+    # 批量删除时每个事务删除的行数（短事务，不长时间占用写锁）
+    DELETE_CHUNK_SIZE = 2000
+    # 增量回收空间时每次释放的页数
+    VACUUM_CHUNK_PAGES = 1000
+    # 结果不确定的图片：未识别到文本，或文本太短无法判断情绪
+    AMBIGUOUS_RESULT = "(filtered_text IS NULL OR filtered_text = '' OR emotion = '未分类')"
+    
     def __init__(self, db_path: str = "meme_finder.db", pool_size: int = 5):
         self.db_path = db_path
+        # 只读连接池，查询不会排在写操作之后
         self.pool = DatabaseConnectionPool(db_path, pool_size)
+        # 所有写操作由单独的写线程执行并按组提交
+        self.writer = DatabaseWriter(db_path, on_commit=self._on_commit)
+        # 全文索引是否可用（需要 SQLite 3.34+ 的 FTS5 trigram 分词器）
+        self.fts_enabled = False
+        # 检查查询计划时记录执行过的查询
+        self._query_log: Optional[List[Tuple[str, Any]]] = None
+        # 每次提交会改变查询结果的写操作后递增，用于判断分页锚点缓存是否过期
+        self._write_version = 0
+        # 查询缓存（分页锚点、情绪分面计数），有写操作提交后整体失效
+        self._query_cache: Dict[str, Dict] = {}
+        self._query_cache_version = -1
         logger.info(f"初始化数据库: {db_path}")
         self.init_database()
     
     @contextmanager
-    def get_cursor(self, commit: bool = False):
-        """获取数据库游标的上下文管理器"""
+    def get_cursor(self):
+        """获取只读查询游标的上下文管理器（写操作使用 _write）"""
         conn = self.pool.get_connection()
         cursor = conn.cursor()
         try:
-            yield cursor
-            if commit:
-                conn.commit()
+            yield cursor if self._query_log is None else _RecordingCursor(cursor, self._query_log)
         except Exception as e:
             conn.rollback()
             logger.error(f"数据库操作失败: {e}")
             raise
         finally:
             cursor.close()
+            self.pool.return_connection(conn)
+    
+    def _write(self, func: Callable[[sqlite3.Cursor], Any], wait: bool = True, invalidate: bool = True):
+        """在写线程中执行写操作 func(cursor)
+        
+        Args:
+            wait: True 时等待提交完成并返回 func 的返回值；False 时立即返回 Future
+            invalidate: 是否使查询缓存失效。只改变搜索/浏览看不到的列或表
+                        （租约、感知哈希、扫描状态、应用状态）时传 False，处理过程中翻页仍可使用缓存
+        """
+        future = self.writer.submit(func, invalidate=invalidate)
+        return future.result() if wait else future
+    
+    def flush(self):
+        """等待已提交（包括 wait=False）的写操作全部写入数据库"""
+        self.writer.flush()
+    
+    def _on_commit(self):
+        # 写线程每次提交后调用
+        self._write_version += 1
     
     def init_database(self):
         """初始化数据库表"""
         logger.info("初始化数据库表结构...")
         
-        with self.get_cursor(commit=True) as cursor:
+        def _create_tables(cursor):
             # 图源文件夹表
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS image_sources (
@@ -124,9 +431,12 @@ class ImageDatabase:
                     folder_path TEXT UNIQUE NOT NULL,
                     added_time TEXT NOT NULL,
                     last_scan_time TEXT,
-                    enabled INTEGER DEFAULT 1
+                    enabled INTEGER DEFAULT 1,
+                    removing INTEGER DEFAULT 0
                 )
             """)
+            # 正在后台删除的图源（中断后下次启动继续删除）
+            self._ensure_column(cursor, 'image_sources', 'removing', 'INTEGER DEFAULT 0')
             
             # 图片信息表
             cursor.execute("""
@@ -142,11 +452,28 @@ class ImageDatabase:
                     emotion_negative REAL,
                     added_time TEXT NOT NULL,
                     processed INTEGER DEFAULT 0,
+                    file_size INTEGER,
+                    quick_hash TEXT,
+                    phash INTEGER,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    ocr_profile TEXT,
                     FOREIGN KEY (source_id) REFERENCES image_sources(id)
                 )
             """)
             
-            # 创建索引
+            # 旧版本数据库迁移：补充快速指纹相关列
+            self._ensure_column(cursor, 'images', 'file_size', 'INTEGER')
+            self._ensure_column(cursor, 'images', 'quick_hash', 'TEXT')
+            # 感知哈希（dHash，有符号 64 位整数）
+            self._ensure_column(cursor, 'images', 'phash', 'INTEGER')
+            # 处理任务租约：领取者及租约到期时间（Unix 时间戳），未领取时为 NULL
+            self._ensure_column(cursor, 'images', 'worker_id', 'TEXT')
+            self._ensure_column(cursor, 'images', 'lease_expires', 'REAL')
+            # 识别结果所用的OCR档位（fast/balanced/accurate），旧数据为 NULL（按 accurate 识别）
+            self._ensure_column(cursor, 'images', 'ocr_profile', 'TEXT')
+            
+            # 创建索引（按 ImageDatabase 中实际的查询形式设计，见 verify_query_plans）
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_file_hash ON images(file_hash)
             """)
@@ -154,13 +481,65 @@ class ImageDatabase:
                 CREATE INDEX IF NOT EXISTS idx_emotion ON images(emotion)
             """)
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_processed ON images(processed)
+                CREATE INDEX IF NOT EXISTS idx_quick_hash ON images(quick_hash)
+            """)
+            # 图源内的哈希查询（覆盖索引，无需回表）
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_source_hash ON images(source_id, file_hash)
+            """)
+            # 游标分页索引（按 added_time, id 排序）
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_added_time_id ON images(added_time, id)
+            """)
+            # processed = ? [AND emotion = ?] ORDER BY added_time DESC, id DESC
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_processed_added_time ON images(processed, added_time, id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_processed_emotion_added_time
+                ON images(processed, emotion, added_time, id)
             """)
+            # 各识别档位的计数、按档位重新识别
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_source_id ON images(source_id)
+                CREATE INDEX IF NOT EXISTS idx_processed_profile ON images(processed, ocr_profile)
             """)
+            # 回收过期租约：只索引已领取的行
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_filtered_text ON images(filtered_text)
+                CREATE INDEX IF NOT EXISTS idx_lease_expires ON images(lease_expires)
+                WHERE lease_expires IS NOT NULL
+            """)
+            # 已被上面的组合索引覆盖（前缀相同）或从未被查询使用的旧索引
+            for index_name in ('idx_processed', 'idx_source_id', 'idx_filtered_text'):
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+            # 文件状态清单表（用于增量扫描，记录每个文件的 stat 信息和哈希）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS file_manifest (
+                    file_path TEXT PRIMARY KEY,
+                    source_id INTEGER NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    file_hash TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_manifest_source_id ON file_manifest(source_id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_manifest_file_hash ON file_manifest(file_hash)
+            """)
+
+            # 目录状态表（记录上次扫描时各目录的 mtime，用于跳过未变化的目录）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scan_dirs (
+                    dir_path TEXT PRIMARY KEY,
+                    source_id INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_scan_dirs_source_id ON scan_dirs(source_id)
             """)
 
             # 应用状态表（用于持久化断点/恢复状态）
@@ -170,19 +549,149 @@ class ImageDatabase:
                     value TEXT
                 )
             """)
+            
+            self._init_fulltext(cursor)
+            self._init_statistics(cursor)
         
+        self._write(_create_tables)
         logger.info("数据库表结构初始化完成")
     
+    def _init_fulltext(self, cursor):
+        """创建 OCR 文本的全文索引（FTS5 trigram，适合中文子串搜索）
+        
+        images_fts 为外部内容表，只存索引不存文本，由触发器与 images 表保持同步。
+        trigram 无法匹配 1-2 个字符的关键词，另建单字索引 images_chars（见 _init_char_index）。
+        SQLite 不支持 FTS5 trigram 时回退为 LIKE 搜索。
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'")
+        exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+                    ocr_text, filtered_text,
+                    content = 'images', content_rowid = 'id',
+                    tokenize = 'trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram 全文索引，使用 LIKE 搜索: {e}")
+            return
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+                INSERT INTO images_fts (rowid, ocr_text, filtered_text)
+                VALUES (new.id, new.ocr_text, new.filtered_text);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+                INSERT INTO images_fts (images_fts, rowid, ocr_text, filtered_text)
+                VALUES ('delete', old.id, old.ocr_text, old.filtered_text);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF ocr_text, filtered_text ON images BEGIN
+                INSERT INTO images_fts (images_fts, rowid, ocr_text, filtered_text)
+                VALUES ('delete', old.id, old.ocr_text, old.filtered_text);
+                INSERT INTO images_fts (rowid, ocr_text, filtered_text)
+                VALUES (new.id, new.ocr_text, new.filtered_text);
+            END
+        """)
+        
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM images)")
+        if not exists and cursor.fetchone()[0]:
+            # 旧版本数据库迁移：为已有记录建立索引
+            cursor.execute("INSERT INTO images_fts (images_fts) VALUES ('rebuild')")
+            logger.info("数据库迁移: 已为已有图片建立全文索引 images_fts")
+        
+        self._init_char_index(cursor)
+        self.fts_enabled = True
+    
+    def _init_char_index(self, cursor):
+        """创建短关键词（1-2 个字符，中文搜索最常见）使用的单字索引 images_chars
+        
+        无内容（contentless）FTS5 表，索引的是 split_chars 拆开的文本，每个字符是一个词；
+        删除时触发器以同样拆开的旧文本删除索引项。
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_chars'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS images_chars USING fts5(
+                ocr_text, filtered_text,
+                content = '',
+                tokenize = "unicode61 remove_diacritics 0 tokenchars '_'"
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_chars_insert AFTER INSERT ON images BEGIN
+                INSERT INTO images_chars (rowid, ocr_text, filtered_text)
+                VALUES (new.id, split_chars(new.ocr_text), split_chars(new.filtered_text));
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_chars_delete AFTER DELETE ON images BEGIN
+                INSERT INTO images_chars (images_chars, rowid, ocr_text, filtered_text)
+                VALUES ('delete', old.id, split_chars(old.ocr_text), split_chars(old.filtered_text));
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS images_chars_update AFTER UPDATE OF ocr_text, filtered_text ON images BEGIN
+                INSERT INTO images_chars (images_chars, rowid, ocr_text, filtered_text)
+                VALUES ('delete', old.id, split_chars(old.ocr_text), split_chars(old.filtered_text));
+                INSERT INTO images_chars (rowid, ocr_text, filtered_text)
+                VALUES (new.id, split_chars(new.ocr_text), split_chars(new.filtered_text));
+            END
+        """)
+        
+        if not exists:
+            # 旧版本数据库迁移：为已有记录建立索引（每行都要有索引项，删除时才能对应）
+            cursor.execute("""
+                INSERT INTO images_chars (rowid, ocr_text, filtered_text)
+                SELECT id, split_chars(ocr_text), split_chars(filtered_text) FROM images
+            """)
+            if cursor.rowcount > 0:
+                logger.info(f"数据库迁移: 已为 {cursor.rowcount} 张图片建立单字索引 images_chars")
+    
+    def _keyword_condition(self, keyword: str) -> Tuple[str, List]:
+        """生成关键词过滤条件
+        
+        关键词不少于 3 个字符时使用全文索引（trigram 按 3 字符切分），
+        1-2 个字母或数字（含汉字）使用单字索引（相邻字符的短语查询）。
+        含标点等分词器会丢弃的字符的短关键词只能逐行 LIKE 匹配。
+        
+        Returns:
+            (SQL 条件, 参数列表)
+        """
+        if self.fts_enabled and len(keyword) > SHORT_KEYWORD_MAX:
+            # 作为短语查询，即子串匹配，与 LIKE '%keyword%' 语义一致
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            return "id IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)", [phrase]
+        if self.fts_enabled and keyword.isalnum():
+            return "id IN (SELECT rowid FROM images_chars WHERE images_chars MATCH ?)", [f'"{split_chars(keyword)}"']
+        return "(filtered_text LIKE ? OR ocr_text LIKE ?)", [f"%{keyword}%", f"%{keyword}%"]
+    
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, definition: str):
+        """列不存在时添加（用于旧版本数据库迁移）"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"数据库迁移: {table} 表添加列 {column}")
+    
     # ==================== 图源管理 ====================
     
     def add_source(self, folder_path: str) -> bool:
         """添加图源文件夹"""
+        def _insert(cursor):
+            cursor.execute("""
+                INSERT INTO image_sources (folder_path, added_time)
+                VALUES (?, ?)
+            """, (folder_path, datetime.now().isoformat()))
+        
         try:
-            with self.get_cursor(commit=True) as cursor:
-                cursor.execute("""
-                    INSERT INTO image_sources (folder_path, added_time)
-                    VALUES (?, ?)
-                """, (folder_path, datetime.now().isoformat()))
+            self._write(_insert)
             logger.info(f"添加图源: {folder_path}")
             return True
         except sqlite3.IntegrityError:
@@ -195,6 +704,7 @@ class ImageDatabase:
             cursor.execute("""
                 SELECT id, folder_path, added_time, last_scan_time, enabled
                 FROM image_sources
+                WHERE removing = 0
                 ORDER BY added_time DESC
             """)
             sources = []
@@ -209,43 +719,267 @@ class ImageDatabase:
         logger.debug(f"获取到 {len(sources)} 个图源")
         return sources
     
-    def remove_source(self, source_id: int):
-        """删除图源"""
-        with self.get_cursor(commit=True) as cursor:
-            # 先获取图源信息
+    def remove_source(self, source_id: int, on_progress: Callable[[int, int], None] = None) -> int:
+        """删除图源及其所有图片记录
+        
+        图源先被标记为删除中（get_sources 不再返回），然后分批删除图片记录和文件状态清单，
+        每批一个短事务，期间识别结果写入和搜索不受影响。耗时与图片数成正比，
+        应在后台线程中调用；中断后 get_removing_sources 仍会返回该图源，再次调用即可继续。
+        
+        Args:
+            on_progress: 每批删除后回调 on_progress(已删除图片数, 图片总数)
+            
+        Returns:
+            删除的图片数
+        """
+        def _mark(cursor):
             cursor.execute("SELECT folder_path FROM image_sources WHERE id = ?", (source_id,))
             row = cursor.fetchone()
             if row:
-                folder_path = row[0]
-                # 删除相关图片
-                cursor.execute("DELETE FROM images WHERE source_id = ?", (source_id,))
-                deleted_images = cursor.rowcount
-                # 删除图源
-                cursor.execute("DELETE FROM image_sources WHERE id = ?", (source_id,))
-                logger.info(f"删除图源: {folder_path} (删除 {deleted_images} 张图片)")
-            else:
-                logger.warning(f"图源不存在: ID={source_id}")
+                cursor.execute("UPDATE image_sources SET enabled = 0, removing = 1 WHERE id = ?", (source_id,))
+            return row[0] if row else None
+        
+        folder_path = self._write(_mark)
+        if folder_path is None:
+            logger.warning(f"图源不存在: ID={source_id}")
+            return 0
+        
+        total = self.get_source_counts().get(source_id, 0)
+        deleted_images = self._delete_in_chunks("images", "source_id = ?", (source_id,),
+                                                total, on_progress)
+        # 删除文件状态清单
+        self._delete_in_chunks("file_manifest", "source_id = ?", (source_id,))
+        self._delete_in_chunks("scan_dirs", "source_id = ?", (source_id,))
+        # 删除图源
+        self._write(lambda cursor: cursor.execute("DELETE FROM image_sources WHERE id = ?", (source_id,)))
+        logger.info(f"删除图源: {folder_path} (删除 {deleted_images} 张图片)")
+        
+        self.incremental_vacuum()
+        return deleted_images
+    
+    def get_removing_sources(self) -> List[int]:
+        """获取上次未删除完成的图源ID（对其再次调用 remove_source 即可继续删除）"""
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT id FROM image_sources WHERE removing = 1")
+            return [row[0] for row in cursor.fetchall()]
+    
+    def _delete_in_chunks(self, table: str, where: str, params: Tuple, total: int = 0,
+                          on_progress: Callable[[int, int], None] = None) -> int:
+        """分批删除 table 中满足 where 的行，每批一个短事务
+        
+        Returns:
+            删除的行数
+        """
+        sql = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)"
+        
+        def _delete(cursor):
+            cursor.execute(sql, (*params, self.DELETE_CHUNK_SIZE))
+            return cursor.rowcount
+        
+        deleted = 0
+        while True:
+            count = self._write(_delete)
+            deleted += count
+            if on_progress and count:
+                on_progress(deleted, max(total, deleted))
+            if count < self.DELETE_CHUNK_SIZE:
+                return deleted
     
     def toggle_source(self, source_id: int, enabled: bool):
         """启用/禁用图源"""
-        with self.get_cursor(commit=True) as cursor:
-            cursor.execute("""
-                UPDATE image_sources 
-                SET enabled = ?
-                WHERE id = ?
-            """, (1 if enabled else 0, source_id))
+        self._write(lambda cursor: cursor.execute("""
+            UPDATE image_sources 
+            SET enabled = ?
+            WHERE id = ?
+        """, (1 if enabled else 0, source_id)))
         logger.info(f"{'启用' if enabled else '禁用'}图源: ID={source_id}")
     
     def update_scan_time(self, source_id: int):
         """更新扫描时间"""
-        with self.get_cursor(commit=True) as cursor:
-            cursor.execute("""
-                UPDATE image_sources 
-                SET last_scan_time = ?
-                WHERE id = ?
-            """, (datetime.now().isoformat(), source_id))
+        scan_time = datetime.now().isoformat()
+        self._write(lambda cursor: cursor.execute("""
+            UPDATE image_sources 
+            SET last_scan_time = ?
+            WHERE id = ?
+        """, (scan_time, source_id)), invalidate=False)
         logger.debug(f"更新扫描时间: ID={source_id}")
     
+    # ==================== 文件状态清单（增量扫描） ====================
+
+    def get_file_manifest(self, source_id: int) -> Dict[str, Tuple[int, int, int, str]]:
+        """获取图源的文件状态清单
+
+        Returns:
+            {file_path: (file_size, mtime_ns, inode, file_hash), ...}
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT file_path, file_size, mtime_ns, inode, file_hash
+                FROM file_manifest
+                WHERE source_id = ?
+            """, (source_id,))
+            manifest = {row[0]: (row[1], row[2], row[3], row[4]) for row in cursor.fetchall()}
+        logger.debug(f"获取文件状态清单: 图源ID={source_id}, {len(manifest)} 条")
+        return manifest
+
+    def get_manifest_slice(self, after_rowid: int, limit: int) -> List[Tuple[int, str, int, int, int, int]]:
+        """按 rowid 顺序分段读取所有图源的文件状态清单（轮询监控每次只检查一段已知文件）
+        
+        Returns:
+            [(rowid, file_path, source_id, file_size, mtime_ns, inode), ...]
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT rowid, file_path, source_id, file_size, mtime_ns, inode
+                FROM file_manifest
+                WHERE rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            """, (after_rowid, limit))
+            return cursor.fetchall()
+
+    def save_file_manifest(self, source_id: int, entries: List[Tuple[str, int, int, int, str]],
+                           removed: List[str] = None):
+        """保存文件状态清单的变更
+
+        Args:
+            entries: 新增或变化的条目 [(file_path, file_size, mtime_ns, inode, file_hash), ...]
+            removed: 已不存在的文件路径列表
+        """
+        if not entries and not removed:
+            return
+
+        def _save(cursor):
+            if entries:
+                cursor.executemany("""
+                    REPLACE INTO file_manifest (file_path, source_id, file_size, mtime_ns, inode, file_hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [(fp, source_id, size, mtime, ino, fh) for fp, size, mtime, ino, fh in entries])
+            if removed:
+                cursor.executemany("DELETE FROM file_manifest WHERE file_path = ?",
+                                   [(fp,) for fp in removed])
+        
+        self._write(_save, invalidate=False)
+        logger.debug(f"保存文件状态清单: 图源ID={source_id}, 更新 {len(entries or [])} 条, "
+                     f"删除 {len(removed or [])} 条")
+
+    def get_dir_mtimes(self, source_id: int) -> Dict[str, int]:
+        """获取图源上次扫描时记录的目录 mtime
+
+        Returns:
+            {dir_path: mtime_ns, ...}
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT dir_path, mtime_ns FROM scan_dirs WHERE source_id = ?", (source_id,))
+            dir_mtimes = dict(cursor.fetchall())
+        logger.debug(f"获取目录状态: 图源ID={source_id}, {len(dir_mtimes)} 个目录")
+        return dir_mtimes
+
+    def save_dir_mtimes(self, source_id: int, entries: List[Tuple[str, int]], removed: List[str] = None):
+        """保存目录 mtime 的变更
+
+        Args:
+            entries: [(dir_path, mtime_ns), ...]
+            removed: 已不存在或需要重新列出的目录路径列表
+        """
+        if not entries and not removed:
+            return
+
+        def _save(cursor):
+            if entries:
+                cursor.executemany("""
+                    REPLACE INTO scan_dirs (dir_path, source_id, mtime_ns)
+                    VALUES (?, ?, ?)
+                """, [(dp, source_id, mtime) for dp, mtime in entries])
+            if removed:
+                cursor.executemany("DELETE FROM scan_dirs WHERE dir_path = ?",
+                                   [(dp,) for dp in removed])
+        
+        self._write(_save, invalidate=False)
+        logger.debug(f"保存目录状态: 图源ID={source_id}, 更新 {len(entries or [])} 个, "
+                     f"删除 {len(removed or [])} 个")
+
+    # ==================== 快速指纹（两级哈希） ====================
+    
+    def get_quick_fingerprints(self) -> Dict[str, Tuple[str, str]]:
+        """获取所有图片的快速指纹
+        
+        Returns:
+            {quick_hash: (file_path, file_hash), ...}
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT quick_hash, file_path, file_hash
+                FROM images
+                WHERE quick_hash IS NOT NULL
+            """)
+            fingerprints = {}
+            for row in cursor.fetchall():
+                fingerprints.setdefault(row[0], (row[1], row[2]))
+        logger.debug(f"获取到 {len(fingerprints)} 个快速指纹")
+        return fingerprints
+    
+    def get_images_without_fingerprint(self) -> List[Tuple[int, str]]:
+        """获取缺少快速指纹的图片（旧版本数据库中的记录）
+        
+        Returns:
+            [(image_id, file_path), ...]
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT id, file_path FROM images WHERE quick_hash IS NULL")
+            rows = cursor.fetchall()
+        logger.debug(f"获取到 {len(rows)} 张缺少快速指纹的图片")
+        return rows
+    
+    def update_fingerprints(self, fingerprints: List[Tuple[int, int, str]]) -> int:
+        """批量补充快速指纹
+        
+        Args:
+            fingerprints: [(image_id, file_size, quick_hash), ...]
+        """
+        if not fingerprints:
+            return 0
+        
+        def _update(cursor):
+            cursor.executemany("""
+                UPDATE images SET file_size = ?, quick_hash = ? WHERE id = ?
+            """, [(size, qh, img_id) for img_id, size, qh in fingerprints])
+            return cursor.rowcount
+        
+        updated = self._write(_update)
+        logger.info(f"补充快速指纹: {updated} 张")
+        return updated
+    
+    def upgrade_file_hashes(self, upgrades: List[Tuple[str, str, str]]) -> int:
+        """快速指纹冲突后，将已有图片的 file_hash 升级为完整哈希
+        
+        冲突的新图片入库时已有图片还是 "q:" 哈希，无法继承其识别结果；
+        升级后再对完整哈希执行一次继承。
+        
+        Args:
+            upgrades: [(file_path, old_hash, full_hash), ...]
+        """
+        if not upgrades:
+            return 0
+        
+        data = [(new, fp, old) for fp, old, new in upgrades]
+        def _upgrade(cursor):
+            cursor.executemany("""
+                UPDATE images SET file_hash = ? WHERE file_path = ? AND file_hash = ?
+            """, data)
+            updated = cursor.rowcount
+            cursor.executemany("""
+                UPDATE file_manifest SET file_hash = ? WHERE file_path = ? AND file_hash = ?
+            """, data)
+            inherited = self._inherit_results(cursor, {new for new, _, _ in data})
+            if inherited:
+                logger.info(f"相同内容图片继承识别结果: {inherited} 张")
+            return updated
+        
+        updated = self._write(_upgrade)
+        logger.debug(f"升级完整哈希: {updated} 张")
+        return updated
+    
     # ==================== 图片管理 ====================
     
     def get_image_hashes(self, source_id: int = None) -> Set[str]:
@@ -259,58 +993,158 @@ class ImageDatabase:
         logger.debug(f"获取到 {len(hashes)} 个图片哈希值")
         return hashes
     
-    def add_image(self, file_path: str, file_hash: str, source_id: int) -> bool:
+    def add_image(self, file_path: str, file_hash: str, source_id: int,
+                  file_size: int = None, quick_hash: str = None) -> bool:
         """添加新图片"""
+        added_time = datetime.now().isoformat()
         try:
-            with self.get_cursor(commit=True) as cursor:
-                cursor.execute("""
-                    INSERT INTO images (file_path, file_hash, source_id, added_time)
-                    VALUES (?, ?, ?, ?)
-                """, (file_path, file_hash, source_id, datetime.now().isoformat()))
+            self._write(lambda cursor: cursor.execute("""
+                INSERT INTO images (file_path, file_hash, source_id, added_time, file_size, quick_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (file_path, file_hash, source_id, added_time, file_size, quick_hash)))
             logger.debug(f"添加图片: {Path(file_path).name}")
             return True
         except sqlite3.IntegrityError:
             logger.debug(f"图片已存在: {Path(file_path).name}")
             return False
     
-    def add_images_batch(self, images: List[Tuple[str, str, int]]) -> int:
-        """批量添加图片
+    def add_images_batch(self, images: List[Tuple]) -> int:
+        """批量添加图片（已存在且内容变化的图片会重置为未处理）
         
         Args:
-            images: [(file_path, file_hash, source_id), ...]
+            images: [(file_path, file_hash, source_id[, file_size, quick_hash[, phash]]), ...]
             
         Returns:
-            成功添加的数量
+            成功添加或更新的数量
         """
         if not images:
             return 0
         
-        added_count = 0
         current_time = datetime.now().isoformat()
+        # 使用executemany进行批量插入
+        data = [(img[0], img[1], img[2], current_time,
+                 img[3] if len(img) > 3 else None,
+                 img[4] if len(img) > 4 else None,
+                 img[5] if len(img) > 5 else None) for img in images]
         
-        try:
-            with self.get_cursor(commit=True) as cursor:
-                # 使用executemany进行批量插入
-                data = [(fp, fh, sid, current_time) for fp, fh, sid in images]
-                cursor.executemany("""
-                    INSERT OR IGNORE INTO images (file_path, file_hash, source_id, added_time)
-                    VALUES (?, ?, ?, ?)
-                """, data)
-                added_count = cursor.rowcount
+        def _insert(cursor):
+            # 同一路径内容变化时更新哈希并重置为未处理
+            cursor.executemany("""
+                    INSERT INTO images (file_path, file_hash, source_id, added_time, file_size, quick_hash, phash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_path) DO UPDATE SET
+                    file_hash = excluded.file_hash,
+                    file_size = excluded.file_size,
+                    quick_hash = excluded.quick_hash,
+                    phash = excluded.phash,
+                    ocr_text = NULL, filtered_text = NULL, emotion = NULL,
+                    emotion_positive = NULL, emotion_negative = NULL, ocr_profile = NULL,
+                    processed = 0, worker_id = NULL, lease_expires = NULL
+                WHERE images.file_hash != excluded.file_hash
+            """, data)
+            added_count = cursor.rowcount
             
+            # 内容相同的图片已处理过时直接继承结果，无需再次OCR
+            inherited = self._inherit_results(cursor, {img[1] for img in images})
+            if inherited:
+                logger.info(f"相同内容图片继承识别结果: {inherited} 张")
+            return added_count
+        
+        try:
+            added_count = self._write(_insert)
             logger.info(f"批量添加图片: {added_count}/{len(images)} 张")
             return added_count
         except Exception as e:
             logger.error(f"批量添加图片失败: {e}")
             return 0
     
+    def add_images_stream(self, images: Iterable[Tuple], batch_size: int = 1000,
+                          on_batch: Callable[[int, int], None] = None) -> int:
+        """流式批量添加图片
+        
+        逐个消费 images（可以是扫描器的生成器），每满 batch_size 条执行一次
+        executemany 并提交，内存占用与图片总数无关。
+        
+        Args:
+            images: 可迭代的 (file_path, file_hash, source_id[, file_size, quick_hash[, phash]])
+            batch_size: 每批条数
+            on_batch: 每批提交后的回调 on_batch(累计添加数, 累计处理数)
+            
+        Returns:
+            成功添加的数量
+        """
+        added_total = 0
+        seen_total = 0
+        batch = []
+        
+        for image in images:
+            batch.append(image)
+            if len(batch) >= batch_size:
+                added_total += self.add_images_batch(batch)
+                seen_total += len(batch)
+                batch = []
+                if on_batch:
+                    on_batch(added_total, seen_total)
+        
+        if batch:
+            added_total += self.add_images_batch(batch)
+            seen_total += len(batch)
+            if on_batch:
+                on_batch(added_total, seen_total)
+        
+        if seen_total:
+            logger.info(f"流式添加图片完成: {added_total}/{seen_total} 张")
+        return added_total
+    
+    def remove_images_by_paths(self, file_paths: List[str]) -> int:
+        """按文件路径批量删除图片记录（文件已被删除时使用）"""
+        if not file_paths:
+            return 0
+        
+        def _delete(cursor):
+            cursor.executemany("DELETE FROM images WHERE file_path = ?",
+                               [(fp,) for fp in file_paths])
+            return cursor.rowcount
+        
+        deleted = self._write(_delete)
+        if deleted:
+            logger.info(f"删除已不存在的图片记录: {deleted} 条")
+        return deleted
+    
+    def _inherit_results(self, cursor, file_hashes: Iterable[str]) -> int:
+        """让未处理的图片继承相同内容（file_hash）已处理图片的识别结果
+        
+        Returns:
+            继承结果的图片数
+        """
+        # processed 前的 + 使其不走以 processed 开头的组合索引（idx_processed_added_time 等，
+        # processed 区分度很低），应使用 idx_file_hash
+        cursor.executemany("""
+            UPDATE images
+            SET (ocr_text, filtered_text, emotion, emotion_positive, emotion_negative, ocr_profile, processed) = (
+                SELECT p.ocr_text, p.filtered_text, p.emotion, p.emotion_positive, p.emotion_negative,
+                       p.ocr_profile, 1
+                FROM images p
+                WHERE p.file_hash = images.file_hash AND +p.processed = 1
+                LIMIT 1
+            )
+            WHERE file_hash = ? AND +processed = 0
+              AND EXISTS (SELECT 1 FROM images p WHERE p.file_hash = images.file_hash AND +p.processed = 1)
+        """, [(file_hash,) for file_hash in file_hashes])
+        return max(cursor.rowcount, 0)
+    
     def get_unprocessed_images(self, limit: int = 100) -> List[Dict]:
-        """获取未处理的图片"""
+        """获取未处理的图片
+        
+        内容相同的图片只返回一张，处理结果写回时会同步到其余副本。
+        """
         with self.get_cursor() as cursor:
             cursor.execute("""
-                SELECT id, file_path, source_id
+                SELECT id, file_path, source_id, phash
                 FROM images
                 WHERE processed = 0
+                  AND id = (SELECT MIN(d.id) FROM images d
+                            WHERE d.file_hash = images.file_hash AND +d.processed = 0)
                 LIMIT ?
             """, (limit,))
             images = []
@@ -318,28 +1152,171 @@ class ImageDatabase:
                 images.append({
                     'id': row[0],
                     'file_path': row[1],
-                    'source_id': row[2]
+                    'source_id': row[2],
+                    'phash': row[3]
                 })
         logger.debug(f"获取到 {len(images)} 张未处理图片")
         return images
     
+    def iter_unprocessed_images(self, batch_size: int = 500) -> Iterator[PendingImage]:
+        """逐条遍历未处理的图片（内容相同的只返回一张）
+        
+        按 (added_time, id) 游标分批读取（idx_processed_added_time），每批读取后即归还连接，
+        内存占用与总数无关。
+        """
+        after = ("", 0)
+        while True:
+            with self.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, file_path, source_id, phash, added_time
+                    FROM images
+                    WHERE processed = 0 AND (added_time, id) > (?, ?)
+                      AND id = (SELECT MIN(d.id) FROM images d
+                                WHERE d.file_hash = images.file_hash AND +d.processed = 0)
+                    ORDER BY added_time, id
+                    LIMIT ?
+                """, (*after, batch_size))
+                rows = cursor.fetchall()
+            for row in rows:
+                yield PendingImage._make(row[:4])
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][4], rows[-1][0])
+    
+    # ==================== 处理任务租约 ====================
+    
+    def claim_images(self, worker_id: str, limit: int = 16, lease_seconds: float = None) -> List[Dict]:
+        """领取一批未处理图片（原子操作，多线程/多进程同时领取也不会重复）
+        
+        领取后图片记录 worker_id 和租约到期时间，处理期间应定期调用 heartbeat 续约；
+        租约过期（如处理进程崩溃、应用被强制关闭）的图片会被再次领取。
+        内容相同的图片只领取一张，处理结果写回时同步到其余副本并释放租约。
+        
+        Args:
+            worker_id: 处理者标识（见 new_worker_id）
+            limit: 最多领取数量
+            lease_seconds: 租约时长，默认 LEASE_SECONDS
+            
+        Returns:
+            [{'id', 'file_path', 'source_id', 'phash'}, ...]
+        """
+        lease_seconds = lease_seconds or self.LEASE_SECONDS
+        
+        def _claim(cursor):
+            # 写线程使用 BEGIN IMMEDIATE，查询与更新之间其他进程无法写入
+            now = time.time()
+            cursor.execute("""
+                SELECT id, file_path, source_id, phash
+                FROM images
+                WHERE processed = 0
+                  AND (lease_expires IS NULL OR lease_expires < ?)
+                  AND id = (SELECT MIN(d.id) FROM images d
+                            WHERE d.file_hash = images.file_hash AND +d.processed = 0)
+                LIMIT ?
+            """, (now, limit))
+            rows = cursor.fetchall()
+            cursor.executemany("UPDATE images SET worker_id = ?, lease_expires = ? WHERE id = ?",
+                               [(worker_id, now + lease_seconds, row[0]) for row in rows])
+            return rows
+        
+        images = [{'id': row[0], 'file_path': row[1], 'source_id': row[2], 'phash': row[3]}
+                  for row in self._write(_claim, invalidate=False)]
+        logger.debug(f"处理者 {worker_id} 领取 {len(images)} 张图片")
+        return images
+    
+    def heartbeat(self, worker_id: str, image_ids: Iterable[int], lease_seconds: float = None) -> int:
+        """为仍由 worker_id 持有的图片续约
+        
+        Returns:
+            续约成功的图片数（少于传入数量说明部分租约已过期并被他人领取）
+        """
+        lease_seconds = lease_seconds or self.LEASE_SECONDS
+        image_ids = list(image_ids)
+        if not image_ids:
+            return 0
+        
+        def _renew(cursor):
+            expires = time.time() + lease_seconds
+            cursor.executemany("""
+                UPDATE images SET lease_expires = ?
+                WHERE id = ? AND worker_id = ? AND processed = 0
+            """, [(expires, image_id, worker_id) for image_id in image_ids])
+            return cursor.rowcount
+        
+        return self._write(_renew, invalidate=False)
+    
+    def release_images(self, worker_id: str, image_ids: Iterable[int]) -> int:
+        """释放尚未处理完的图片（暂停/停止处理时调用），使其可被立即领取"""
+        image_ids = list(image_ids)
+        if not image_ids:
+            return 0
+        
+        def _release(cursor):
+            cursor.executemany("""
+                UPDATE images SET worker_id = NULL, lease_expires = NULL
+                WHERE id = ? AND worker_id = ?
+            """, [(image_id, worker_id) for image_id in image_ids])
+            return cursor.rowcount
+        
+        released = self._write(_release, invalidate=False)
+        logger.debug(f"处理者 {worker_id} 释放 {released} 张图片")
+        return released
+    
+    def reclaim_expired_leases(self) -> int:
+        """清除已过期的租约（领取时会自动跳过过期租约，此方法仅用于清理）
+        
+        Returns:
+            清除的租约数
+        """
+        def _reclaim(cursor):
+            cursor.execute("""
+                UPDATE images SET worker_id = NULL, lease_expires = NULL
+                WHERE lease_expires < ?
+            """, (time.time(),))
+            return cursor.rowcount
+        
+        reclaimed = self._write(_reclaim, invalidate=False)
+        if reclaimed:
+            logger.info(f"回收过期的处理租约: {reclaimed} 张")
+        return reclaimed
+    
+    @staticmethod
+    def new_worker_id() -> str:
+        """生成处理者标识（主机名:进程号:随机后缀），多进程共享数据库时也不会重复"""
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    
     def update_image_data(self, image_id: int, ocr_text: str, filtered_text: str, 
-                         emotion: str, pos_score: float, neg_score: float):
-        """更新图片处理结果"""
-        with self.get_cursor(commit=True) as cursor:
+                         emotion: str, pos_score: float, neg_score: float, profile: str = None,
+                         wait: bool = True):
+        """更新图片处理结果（同时写入内容相同的未处理图片）
+        
+        Args:
+            profile: 识别所用的OCR档位（见 OCRProcessor.PROFILES）
+            wait: False 时不等待提交，立即返回 Future（处理循环中使用，与其他写操作合并提交）
+        
+        Returns:
+            同步更新的相同内容图片数（不含本图片）；wait=False 时为其 Future
+        """
+        def _update(cursor):
             cursor.execute("""
                 UPDATE images 
                 SET ocr_text = ?, filtered_text = ?, emotion = ?,
-                    emotion_positive = ?, emotion_negative = ?, processed = 1
+                    emotion_positive = ?, emotion_negative = ?, ocr_profile = ?, processed = 1,
+                    worker_id = NULL, lease_expires = NULL
                 WHERE id = ?
-            """, (ocr_text, filtered_text, emotion, pos_score, neg_score, image_id))
-        logger.debug(f"更新图片数据: ID={image_id}, 情绪={emotion}")
+                   OR (+processed = 0 AND file_hash = (SELECT file_hash FROM images WHERE id = ?))
+            """, (ocr_text, filtered_text, emotion, pos_score, neg_score, profile, image_id, image_id))
+            duplicates = max(cursor.rowcount - 1, 0)
+            logger.debug(f"更新图片数据: ID={image_id}, 情绪={emotion}, 相同内容={duplicates}")
+            return duplicates
+        
+        return self._write(_update, wait)
     
     def update_images_batch(self, updates: List[Tuple[int, str, str, str, float, float]]) -> int:
         """批量更新图片数据
         
         Args:
-            updates: [(image_id, ocr_text, filtered_text, emotion, pos_score, neg_score), ...]
+            updates: [(image_id, ocr_text, filtered_text, emotion, pos_score, neg_score[, profile]), ...]
             
         Returns:
             更新的数量
@@ -347,25 +1324,211 @@ class ImageDatabase:
         if not updates:
             return 0
         
+        # 准备批量更新数据
+        data = [(u[1], u[2], u[3], u[4], u[5], u[6] if len(u) > 6 else None, 1, u[0], u[0])
+                for u in updates]
+        
+        def _update(cursor):
+            # 内容相同的未处理图片同步写入
+            cursor.executemany("""
+                UPDATE images 
+                SET ocr_text = ?, filtered_text = ?, emotion = ?,
+                    emotion_positive = ?, emotion_negative = ?, ocr_profile = ?, processed = ?,
+                    worker_id = NULL, lease_expires = NULL
+                WHERE id = ?
+                   OR (+processed = 0 AND file_hash = (SELECT file_hash FROM images WHERE id = ?))
+            """, data)
+            return cursor.rowcount
+        
         try:
-            with self.get_cursor(commit=True) as cursor:
-                # 准备批量更新数据
-                data = [(ocr, filt, emo, pos, neg, 1, img_id) 
-                       for img_id, ocr, filt, emo, pos, neg in updates]
-                cursor.executemany("""
-                    UPDATE images 
-                    SET ocr_text = ?, filtered_text = ?, emotion = ?,
-                        emotion_positive = ?, emotion_negative = ?, processed = ?
-                    WHERE id = ?
-                """, data)
-                updated_count = cursor.rowcount
-            
+            updated_count = self._write(_update)
             logger.info(f"批量更新图片数据: {updated_count} 张")
             return updated_count
         except Exception as e:
             logger.error(f"批量更新图片数据失败: {e}")
             return 0
     
+    # ==================== 相似图片（感知哈希） ====================
+    
+    def get_processed_phashes(self) -> List[Tuple[int, int]]:
+        """获取已处理图片的感知哈希（用于构建 BK 树）
+        
+        Returns:
+            [(image_id, phash), ...]
+        """
+        return list(self.iter_processed_phashes())
+    
+    def iter_processed_phashes(self, batch_size: int = 5000) -> Iterator[Tuple[int, int]]:
+        """逐条遍历已处理图片的感知哈希 (image_id, phash)，按 (added_time, id) 游标分批读取"""
+        after = ("", 0)
+        while True:
+            with self.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, phash, added_time FROM images
+                    WHERE processed = 1 AND (added_time, id) > (?, ?) AND phash IS NOT NULL
+                    ORDER BY added_time, id
+                    LIMIT ?
+                """, (*after, batch_size))
+                rows = cursor.fetchall()
+            for image_id, phash, _ in rows:
+                yield image_id, phash
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][2], rows[-1][0])
+    
+    def get_image_path(self, image_id: int) -> Optional[str]:
+        """获取图片路径（不存在时返回 None）"""
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT file_path FROM images WHERE id = ?", (image_id,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def set_phash(self, image_id: int, phash: int):
+        """记录图片的感知哈希（旧记录在处理时补算）"""
+        self._write(lambda cursor: cursor.execute("UPDATE images SET phash = ? WHERE id = ?", (phash, image_id)),
+                    wait=False, invalidate=False)
+    
+    def copy_image_result(self, source_image_id: int, image_id: int) -> Optional[Dict]:
+        """将相似图片的识别结果复制给指定图片（同时写入内容相同的未处理图片）
+        
+        Returns:
+            复制的结果 {'ocr_text', 'filtered_text', 'emotion', 'emotion_positive', 'emotion_negative',
+            'ocr_profile'}，源图片未处理时返回 None
+        """
+        # 源图片的结果可能还在写队列中
+        self.flush()
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT ocr_text, filtered_text, emotion, emotion_positive, emotion_negative, ocr_profile
+                FROM images WHERE id = ? AND processed = 1
+            """, (source_image_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        
+        self.update_image_data(image_id, *row)
+        return {
+            'ocr_text': row[0],
+            'filtered_text': row[1],
+            'emotion': row[2],
+            'emotion_positive': row[3],
+            'emotion_negative': row[4],
+            'ocr_profile': row[5]
+        }
+    
+    # ==================== 识别档位 ====================
+    
+    def get_profile_counts(self) -> Dict[Optional[str], int]:
+        """各识别档位的已处理图片数（None 为记录档位之前处理的图片）"""
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT ocr_profile, COUNT(*) FROM images WHERE processed = 1 GROUP BY ocr_profile
+            """)
+            return dict(cursor.fetchall())
+    
+    def requeue_images(self, profiles: Iterable[str], only_ambiguous: bool = True,
+                       on_progress: Callable[[int, int], None] = None) -> int:
+        """把以指定档位识别的图片重置为未处理，以便换用更精确的档位重新识别
+        
+        例如先以 fast 档位批量识别，再以 accurate 档位只重新识别结果不确定的图片。
+        原有结果保留到重新识别完成时被覆盖，但重置后的图片为未处理状态，
+        在此期间不会出现在搜索和浏览结果中。分批短事务更新，应在后台线程中调用。
+        
+        Args:
+            profiles: 要重新识别的档位，如 ['fast', 'balanced']
+            only_ambiguous: 只重置结果不确定的图片（见 AMBIGUOUS_RESULT）
+            on_progress: 每批更新后回调 on_progress(已重置数, 总数)
+        
+        Returns:
+            重置的图片数
+        """
+        profiles = list(profiles)
+        if not profiles:
+            return 0
+        where = f"processed = 1 AND ocr_profile IN ({','.join('?' * len(profiles))})"
+        if only_ambiguous:
+            where += f" AND {self.AMBIGUOUS_RESULT}"
+        with self.get_cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM images WHERE {where}", profiles)
+            total = cursor.fetchone()[0]
+        
+        # 重置后的行不再满足条件，每批重新查找即可
+        sql = f"""
+            UPDATE images SET processed = 0, worker_id = NULL, lease_expires = NULL
+            WHERE rowid IN (SELECT rowid FROM images WHERE {where} LIMIT ?)
+        """
+        
+        def _requeue(cursor):
+            cursor.execute(sql, (*profiles, self.DELETE_CHUNK_SIZE))
+            return cursor.rowcount
+        
+        requeued = 0
+        while True:
+            count = self._write(_requeue)
+            requeued += count
+            if on_progress and count:
+                on_progress(requeued, max(total, requeued))
+            if count < self.DELETE_CHUNK_SIZE:
+                break
+        
+        logger.info(f"重新识别: {requeued} 张图片（档位: {', '.join(profiles)}）已重置为未处理")
+        return requeued
+    
+    # ==================== 移动/重命名识别 ====================
+    
+    def get_orphan_images(self, source_id: int) -> List[Tuple[str, str]]:
+        """获取图源中在文件状态清单里已没有对应文件的图片记录
+        
+        Returns:
+            [(file_path, file_hash), ...]
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT i.file_path, i.file_hash
+                FROM images i
+                LEFT JOIN file_manifest m ON m.file_path = i.file_path
+                WHERE i.source_id = ? AND m.file_path IS NULL
+            """, (source_id,))
+            return cursor.fetchall()
+    
+    def get_unlinked_paths(self, source_id: int, file_hashes: Iterable[str]) -> Dict[str, List[str]]:
+        """获取清单中有文件、但 images 表中没有记录的路径（按哈希分组，只返回指定哈希）
+        
+        Returns:
+            {file_hash: [file_path, ...]}
+        """
+        result: Dict[str, List[str]] = {}
+        with self.get_cursor() as cursor:
+            for file_hash in set(file_hashes):
+                cursor.execute("""
+                    SELECT m.file_path
+                    FROM file_manifest m
+                    LEFT JOIN images i ON i.file_path = m.file_path
+                    WHERE m.source_id = ? AND m.file_hash = ? AND i.id IS NULL
+                """, (source_id, file_hash))
+                paths = sorted(row[0] for row in cursor.fetchall())
+                if paths:
+                    result[file_hash] = paths
+        return result
+    
+    def move_images(self, moves: List[Tuple[str, str]]) -> int:
+        """更新被移动/重命名图片的路径，保留识别结果
+        
+        Args:
+            moves: [(old_path, new_path), ...]
+        """
+        if not moves:
+            return 0
+        
+        def _move(cursor):
+            cursor.executemany("UPDATE images SET file_path = ? WHERE file_path = ?",
+                               [(new_path, old_path) for old_path, new_path in moves])
+            return cursor.rowcount
+        
+        moved = self._write(_move)
+        logger.info(f"识别到移动/重命名的图片: {moved} 张")
+        return moved
+    
     # ==================== 搜索功能 ====================
     
     def search_images(self, keyword: str = "", emotion: str = "", limit: int = 100) -> List[Dict]:
@@ -380,8 +1543,9 @@ class ImageDatabase:
             params = []
             
             if keyword:
-                query += " AND (filtered_text LIKE ? OR ocr_text LIKE ?)"
-                params.extend([f"%{keyword}%", f"%{keyword}%"])
+                condition, keyword_params = self._keyword_condition(keyword)
+                query += f" AND {condition}"
+                params.extend(keyword_params)
             
             if emotion:
                 query += " AND emotion = ?"
@@ -405,78 +1569,387 @@ class ImageDatabase:
         logger.info(f"搜索图片: 关键词='{keyword}', 情绪='{emotion}', 结果={len(results)}张")
         return results
 
+    def _image_filters(self, processed: int = None, keyword: str = "", emotion: str = "") -> Tuple[str, List]:
+        """生成图片列表的过滤条件
+        
+        Returns:
+            (WHERE 子句, 参数列表)
+        """
+        conditions = []
+        params = []
+        if processed is not None:
+            conditions.append("processed = ?")
+            params.append(processed)
+        if keyword:
+            condition, keyword_params = self._keyword_condition(keyword)
+            conditions.append(condition)
+            params.extend(keyword_params)
+        if emotion:
+            conditions.append("emotion = ?")
+            params.append(emotion)
+        return " AND ".join(conditions) or "1=1", params
+    
+    def _count_from_statistics(self, processed: int = None, emotion: str = "") -> Optional[int]:
+        """无关键词时直接从统计计数器得到数量，无法得到时返回 None"""
+        if emotion:
+            if processed != 1:
+                return None
+            keys = [('emotion', emotion)]
+        elif processed is None:
+            keys = [('total', '')]
+        else:
+            keys = [('total', ''), ('processed', '')]
+        
+        with self.get_cursor() as cursor:
+            counts = []
+            for kind, name in keys:
+                cursor.execute("SELECT count FROM image_stats WHERE kind = ? AND name = ?", (kind, name))
+                row = cursor.fetchone()
+                counts.append(row[0] if row else 0)
+        
+        if processed == 1 and not emotion:
+            return counts[1]
+        if processed == 0:
+            return counts[0] - counts[1]
+        return counts[0]
+    
     def get_images_count(self, processed: int = None, keyword: str = "", emotion: str = "") -> int:
         """获取符合条件的图片总数（用于分页）
 
         Args:
             processed: 1 for 已处理，0 为未处理，None 表示全部
         """
-        with self.get_cursor() as cursor:
-            query = "SELECT COUNT(*) FROM images WHERE 1=1"
-            params = []
-            if processed is not None:
-                query += " AND processed = ?"
-                params.append(processed)
-            if keyword:
-                query += " AND (filtered_text LIKE ? OR ocr_text LIKE ?)"
-                params.extend([f"%{keyword}%", f"%{keyword}%"])
-            if emotion:
-                query += " AND emotion = ?"
-                params.append(emotion)
-
-            cursor.execute(query, params)
-            total = cursor.fetchone()[0]
+        total = None if keyword else self._count_from_statistics(processed, emotion)
+        if total is None:
+            where, params = self._image_filters(processed, keyword, emotion)
+            with self.get_cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM images WHERE {where}", params)
+                total = cursor.fetchone()[0]
         
         logger.debug(f"统计图片数量: {total} 张 (processed={processed}, keyword='{keyword}', emotion='{emotion}')")
         return total
 
+    def get_images_after(self, after: Tuple[str, int] = None, page_size: int = 20, processed: int = None,
+                         keyword: str = "", emotion: str = "") -> List[Dict]:
+        """游标分页：返回排在 after 之后的一页记录（按 added_time, id 倒序）
+
+        通过索引直接定位到 after 所在位置，耗时与页的深度无关。
+
+        Args:
+            after: 上一页最后一条记录的 (added_time, id)，None 表示第一页
+            page_size: 每页条数
+            processed: 1/0/None 同 get_images_count
+
+        Returns:
+            记录列表，下一页的游标为最后一条记录的 (added_time, id)
+        """
+        results = []
+        for row in self._image_rows_after(after, page_size, processed, keyword, emotion):
+            record = row._asdict()
+            record['processed'] = bool(row.processed)
+            results.append(record)
+        return results
+    
+    def _image_rows_after(self, after: Optional[Tuple[str, int]], page_size: int, processed: int = None,
+                          keyword: str = "", emotion: str = "") -> List[ImageRow]:
+        """get_images_after / iter_images 共用的游标分页查询"""
+        where, params = self._image_filters(processed, keyword, emotion)
+        if after is not None:
+            where += " AND (added_time, id) < (?, ?)"
+            params.extend(after)
+        
+        with self.get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT id, file_path, filtered_text, emotion, emotion_positive, emotion_negative,
+                       processed, added_time
+                FROM images
+                WHERE {where}
+                ORDER BY added_time DESC, id DESC
+                LIMIT ?
+            """, params + [page_size])
+            return [ImageRow._make(row) for row in cursor]
+    
+    def iter_images(self, processed: int = None, keyword: str = "", emotion: str = "",
+                    batch_size: int = 500) -> Iterator[ImageRow]:
+        """逐条遍历符合条件的图片（按 added_time, id 倒序，过滤条件同 get_images_count）
+        
+        按游标分页分批读取，每批读取后即归还连接，遍历整个图库时内存占用保持不变。
+        
+        Yields:
+            ImageRow(id, file_path, text, emotion, pos_score, neg_score, processed, added_time)
+        """
+        after = None
+        while True:
+            rows = self._image_rows_after(after, batch_size, processed, keyword, emotion)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1].added_time, rows[-1].id)
+
+    def _page_anchors(self, filters: Tuple) -> Dict[int, Optional[Tuple[str, int]]]:
+        """获取某组过滤条件的页锚点缓存 {页码: 上一页最后一条记录的 (added_time, id)}
+        
+        有数据写入后页码与记录的对应关系会变化，缓存整体失效。
+        """
+        cache = self._cache('anchors')
+        if filters not in cache:
+            self._cache_put(cache, filters, {1: None})
+        return cache[filters]
+    
+    def _cache(self, name: str) -> Dict:
+        """获取某类查询缓存（有改变查询结果的写操作提交后整体失效）"""
+        if self._query_cache_version != self._write_version:
+            self._query_cache = {}
+            self._query_cache_version = self._write_version
+        return self._query_cache.setdefault(name, {})
+    
+    def _cache_put(self, cache: Dict, key, value):
+        """写入查询缓存（条目过多时先清空）"""
+        if len(cache) >= self.QUERY_CACHE_SIZE:
+            cache.clear()
+        cache[key] = value
+
+    def _seek_page_anchor(self, anchors: Dict[int, Optional[Tuple[str, int]]], start: int, page: int,
+                          page_size: int, where: str, params: List) -> bool:
+        """从已知锚点 start 向后只扫描 (added_time, id) 到 page 页，沿途每隔
+        PAGE_ANCHOR_STRIDE 页记录一个锚点
+        
+        Returns:
+            page 页是否存在
+        """
+        after = anchors[start]
+        if after is not None:
+            where += " AND (added_time, id) < (?, ?)"
+            params = params + list(after)
+        
+        with self.get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT added_time, id FROM images
+                WHERE {where}
+                ORDER BY added_time DESC, id DESC
+                LIMIT ?
+            """, params + [(page - start) * page_size])
+            for index, key in enumerate(cursor, 1):
+                if index % page_size:
+                    continue
+                next_page = start + index // page_size
+                if next_page == page or (next_page - 1) % self.PAGE_ANCHOR_STRIDE == 0:
+                    anchors[next_page] = key
+        return page in anchors
+
     def get_images_page(self, page: int = 1, page_size: int = 20, processed: int = None,
                         keyword: str = "", emotion: str = "") -> List[Dict]:
         """分页获取图片数据，返回指定页的记录列表
 
+        基于 (added_time, id) 游标分页：顺序翻页直接使用上一页记录的游标；
+        跳转到任意页时从最近的已缓存锚点开始，只扫描索引中的键定位到目标页。
+
         Args:
             page: 页码，从1开始
             page_size: 每页条数
             processed: 1/0/None 同 get_images_count
         """
-        offset = max(0, (page - 1) * page_size)
+        page = max(1, page)
+        anchors = self._page_anchors((page_size, processed, keyword, emotion))
         
-        with self.get_cursor() as cursor:
-            query = "SELECT id, file_path, filtered_text, emotion, emotion_positive, emotion_negative, processed FROM images WHERE 1=1"
-            params = []
-            if processed is not None:
-                query += " AND processed = ?"
-                params.append(processed)
-            if keyword:
-                query += " AND (filtered_text LIKE ? OR ocr_text LIKE ?)"
-                params.extend([f"%{keyword}%", f"%{keyword}%"])
-            if emotion:
-                query += " AND emotion = ?"
-                params.append(emotion)
-
-            query += " ORDER BY added_time DESC LIMIT ? OFFSET ?"
-            params.extend([page_size, offset])
-
-            cursor.execute(query, params)
-            results = []
-            for row in cursor.fetchall():
-                results.append({
-                    'id': row[0],
-                    'file_path': row[1],
-                    'text': row[2],
-                    'emotion': row[3],
-                    'pos_score': row[4],
-                    'neg_score': row[5],
-                    'processed': bool(row[6])
-                })
+        if page not in anchors:
+            start = max(p for p in anchors if p < page)
+            where, params = self._image_filters(processed, keyword, emotion)
+            if not self._seek_page_anchor(anchors, start, page, page_size, where, params):
+                logger.debug(f"分页查询: 第{page}页超出范围")
+                return []
+        
+        results = self.get_images_after(anchors[page], page_size, processed, keyword, emotion)
+        if len(results) == page_size:
+            anchors[page + 1] = (results[-1]['added_time'], results[-1]['id'])
         
         logger.debug(f"分页查询: 第{page}页, 每页{page_size}条, 返回{len(results)}条")
         return results
     
+    def get_emotion_facets(self, processed: int = 1, keyword: str = "") -> Dict[Optional[str], int]:
+        """获取符合条件的图片按情绪分组的数量（分面计数），结果会被缓存直到数据变化
+        
+        领取/续约租约、记录感知哈希等不改变查询结果的写操作不会使缓存失效，
+        处理过程中翻页仍直接使用缓存的计数。
+        
+        Returns:
+            {情绪: 数量}，情绪为空的图片计入 None
+        """
+        cache = self._cache('facets')
+        key = (processed, keyword)
+        if key in cache:
+            return cache[key]
+        
+        if not keyword and processed == 1:
+            # 直接读取统计计数器
+            facets = {emotion: count for emotion, count in self.get_statistics()['emotions'].items()}
+        else:
+            where, params = self._image_filters(processed, keyword)
+            with self.get_cursor() as cursor:
+                cursor.execute(f"SELECT emotion, COUNT(*) FROM images WHERE {where} GROUP BY emotion", params)
+                facets = dict(cursor.fetchall())
+        
+        self._cache_put(cache, key, facets)
+        return facets
+    
+    def search_page(self, page: int = 1, page_size: int = 20, processed: int = 1,
+                    keyword: str = "", emotion: str = "") -> Dict:
+        """一次调用获取搜索结果页、总数和情绪分面
+        
+        总数由分面计数求和得到，与分面共用一次分组查询（关键词相同时翻页不再重复计算，
+        只有新的识别结果等会改变查询结果的写入才使其失效，见 _write 的 invalidate），
+        结果页使用游标分页读取。
+        
+        Args:
+            page: 页码，从1开始，超出范围时取最后一页
+            page_size: 每页条数
+            processed: 1/0/None 同 get_images_count
+            keyword: 关键词
+            emotion: 情绪筛选（分面计数不受其影响）
+            
+        Returns:
+            {'results': [...], 'total': 总数, 'page': 实际页码, 'total_pages': 总页数,
+             'facets': {情绪: 数量}}
+        """
+        facets = self.get_emotion_facets(processed, keyword)
+        total = facets.get(emotion, 0) if emotion else sum(facets.values())
+        total_pages = max(1, (total + page_size - 1) // page_size)
+        page = min(max(1, page), total_pages)
+        
+        results = self.get_images_page(page, page_size, processed, keyword, emotion) if total else []
+        return {
+            'results': results,
+            'total': total,
+            'page': page,
+            'total_pages': total_pages,
+            'facets': facets
+        }
+    
     # ==================== 统计信息 ====================
     
+    def _init_statistics(self, cursor):
+        """创建由触发器维护的统计表，读取统计信息时无需扫描 images 表
+        
+        image_stats 中每行是一个计数器 (kind, name, count)：
+        - ('total', '')：图片总数
+        - ('processed', '')：已处理数
+        - ('emotion', 情绪)：已处理图片的情绪分布（情绪为空时 name 为 ''）
+        - ('source', 图源ID)：各图源的图片数
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_stats'")
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS image_stats (
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, name)
+            )
+        """)
+        
+        def _bump(kind: str, name: str, delta: str, when: str = "") -> str:
+            # 计数器加 delta（行不存在时创建）
+            where = f"WHERE {when}" if when else "WHERE 1"
+            return f"""
+                INSERT INTO image_stats (kind, name, count)
+                SELECT '{kind}', {name}, {delta} {where}
+                ON CONFLICT (kind, name) DO UPDATE SET count = count + excluded.count;"""
+        
+        no_name = "''"
+        old_source = "COALESCE(old.source_id, '')"
+        new_source = "COALESCE(new.source_id, '')"
+        old_emotion = "COALESCE(old.emotion, '')"
+        new_emotion = "COALESCE(new.emotion, '')"
+        
+        insert_body = (_bump('total', no_name, '1')
+                       + _bump('source', new_source, '1')
+                       + _bump('processed', no_name, '1', 'new.processed = 1')
+                       + _bump('emotion', new_emotion, '1', 'new.processed = 1'))
+        delete_body = (_bump('total', no_name, '-1')
+                       + _bump('source', old_source, '-1')
+                       + _bump('processed', no_name, '-1', 'old.processed = 1')
+                       + _bump('emotion', old_emotion, '-1', 'old.processed = 1'))
+        update_body = (_bump('source', old_source, '-1')
+                       + _bump('source', new_source, '1')
+                       + _bump('processed', no_name, '(new.processed = 1) - (old.processed = 1)')
+                       + _bump('emotion', old_emotion, '-1', 'old.processed = 1')
+                       + _bump('emotion', new_emotion, '1', 'new.processed = 1'))
+        
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS image_stats_insert AFTER INSERT ON images BEGIN
+                {insert_body}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS image_stats_delete AFTER DELETE ON images BEGIN
+                {delete_body}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS image_stats_update AFTER UPDATE OF processed, emotion, source_id ON images
+            WHEN old.processed IS NOT new.processed OR old.emotion IS NOT new.emotion
+              OR old.source_id IS NOT new.source_id
+            BEGIN
+                {update_body}
+            END
+        """)
+        
+        if not exists:
+            # 旧版本数据库迁移：按现有数据初始化计数器
+            self._rebuild_statistics(cursor)
+    
+    @staticmethod
+    def _rebuild_statistics(cursor):
+        """按 images 表重新计算全部计数器"""
+        cursor.execute("DELETE FROM image_stats")
+        cursor.execute("""
+            INSERT INTO image_stats (kind, name, count)
+            SELECT 'total', '', COUNT(*) FROM images
+            UNION ALL
+            SELECT 'processed', '', COUNT(*) FROM images WHERE processed = 1
+            UNION ALL
+            SELECT 'emotion', COALESCE(emotion, ''), COUNT(*) FROM images WHERE processed = 1
+            GROUP BY COALESCE(emotion, '')
+            UNION ALL
+            SELECT 'source', COALESCE(source_id, ''), COUNT(*) FROM images GROUP BY source_id
+        """)
+    
     def get_statistics(self) -> Dict:
-        """获取统计信息"""
+        """获取统计信息（读取触发器维护的计数器，耗时与图片数量无关）"""
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT kind, name, count FROM image_stats WHERE kind != 'source'")
+            counters = cursor.fetchall()
+        
+        total = 0
+        processed = 0
+        emotions = {}
+        for kind, name, count in counters:
+            if kind == 'total':
+                total = count
+            elif kind == 'processed':
+                processed = count
+            elif count:
+                emotions[name or None] = count
+        
+        stats = {
+            'total': total,
+            'processed': processed,
+            'unprocessed': total - processed,
+            'emotions': emotions
+        }
+        
+        logger.debug(f"统计信息: 总数={total}, 已处理={processed}, 未处理={total-processed}")
+        return stats
+    
+    def get_source_counts(self) -> Dict[int, int]:
+        """获取各图源的图片数 {source_id: 数量}"""
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT name, count FROM image_stats WHERE kind = 'source' AND count > 0")
+            return {int(name): count for name, count in cursor.fetchall() if name.isdigit()}
+    
+    def compute_statistics(self) -> Dict:
+        """直接扫描 images 表计算统计信息（慢，用于校验计数器）"""
         with self.get_cursor() as cursor:
             # 总图片数
             cursor.execute("SELECT COUNT(*) FROM images")
@@ -495,22 +1968,39 @@ class ImageDatabase:
             """)
             emotions = dict(cursor.fetchall())
         
-        stats = {
+        return {
             'total': total,
             'processed': processed,
             'unprocessed': total - processed,
             'emotions': emotions
         }
+    
+    def check_statistics(self, repair: bool = True) -> bool:
+        """校验计数器与 images 表是否一致
         
-        logger.debug(f"统计信息: 总数={total}, 已处理={processed}, 未处理={total-processed}")
-        return stats
+        Args:
+            repair: 不一致时是否重新计算计数器
+            
+        Returns:
+            是否一致
+        """
+        expected = self.compute_statistics()
+        actual = self.get_statistics()
+        if expected == actual:
+            return True
+        
+        logger.warning(f"统计计数器不一致: 计数器={actual}, 实际={expected}")
+        if repair:
+            self._write(self._rebuild_statistics)
+            logger.info("统计计数器已重新计算")
+        return False
     
     # ==================== 应用状态持久化（断点/恢复） ====================
 
     def set_app_state(self, key: str, value: str):
         """设置应用状态键值（持久化）"""
-        with self.get_cursor(commit=True) as cursor:
-            cursor.execute("REPLACE INTO app_state (key, value) VALUES (?, ?)", (key, value))
+        self._write(lambda cursor: cursor.execute(
+            "REPLACE INTO app_state (key, value) VALUES (?, ?)", (key, value)), invalidate=False)
         logger.debug(f"保存应用状态: {key} = {value}")
 
     def get_app_state(self, key: str) -> str:
@@ -528,21 +2018,55 @@ class ImageDatabase:
     def vacuum(self):
         """优化数据库，回收空间"""
         logger.info("开始数据库VACUUM优化...")
-        conn = self.pool.get_connection()
         try:
-            conn.execute("VACUUM")
-            conn.commit()
+            # VACUUM 不能在事务中执行，由写线程单独执行
+            self.writer.submit(lambda cursor: cursor.execute("VACUUM"), transaction=False).result()
             logger.info("数据库VACUUM优化完成")
         except Exception as e:
             logger.error(f"数据库VACUUM失败: {e}")
-        finally:
-            self.pool.return_connection(conn)
     
-    def delete_processed_images(self, days: int = 30) -> int:
-        """删除N天前处理过的图片记录
+    def incremental_vacuum(self) -> int:
+        """分批回收已删除数据占用的空间（需要数据库为 auto_vacuum=INCREMENTAL）
+        
+        每批释放 VACUUM_CHUNK_PAGES 页，不像 VACUUM 那样长时间独占数据库。
+        
+        Returns:
+            回收的页数
+        """
+        def _free_pages(cursor):
+            cursor.execute("PRAGMA auto_vacuum")
+            if cursor.fetchone()[0] != 2:
+                return None
+            cursor.execute("PRAGMA freelist_count")
+            return cursor.fetchone()[0]
+        
+        def _release(cursor):
+            # execute 只执行一步（只释放一页），executescript 会执行到完成
+            cursor.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_CHUNK_PAGES});")
+        
+        free_pages = self._write(_free_pages, invalidate=False)
+        if free_pages is None:
+            logger.debug("数据库未启用增量空间回收，执行一次 vacuum() 后生效")
+            return 0
+        
+        remaining = free_pages
+        while remaining:
+            # executescript 会先提交当前事务，因此在事务之外单独执行
+            self.writer.submit(_release, transaction=False).result()
+            remaining = self._write(_free_pages, invalidate=False)
+        if free_pages:
+            # 检查点后释放的页才会从数据库文件中截去
+            self.writer.submit(lambda cursor: cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall(),
+                               transaction=False).result()
+            logger.info(f"增量回收空间: {free_pages} 页")
+        return free_pages
+    
+    def delete_processed_images(self, days: int = 30, on_progress: Callable[[int, int], None] = None) -> int:
+        """删除N天前处理过的图片记录（分批短事务删除，应在后台线程中调用）
         
         Args:
             days: 保留最近N天的数据
+            on_progress: 每批删除后回调 on_progress(已删除数, 总数)
             
         Returns:
             删除的记录数
@@ -550,17 +2074,105 @@ class ImageDatabase:
         from datetime import timedelta
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
-        with self.get_cursor(commit=True) as cursor:
-            cursor.execute("""
-                DELETE FROM images 
-                WHERE processed = 1 AND added_time < ?
-            """, (cutoff_date,))
-            deleted = cursor.rowcount
+        where = "processed = 1 AND added_time < ?"
+        with self.get_cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM images WHERE {where}", (cutoff_date,))
+            total = cursor.fetchone()[0]
+        
+        deleted = self._delete_in_chunks("images", where, (cutoff_date,), total, on_progress)
         
         logger.info(f"清理旧数据: 删除了 {deleted} 条 {days} 天前的记录")
+        self.incremental_vacuum()
         return deleted
     
+    # ==================== 查询计划检查 ====================
+    
+    # 很小的表，全表扫描没有问题
+    PLAN_SMALL_TABLES = {'image_sources', 'app_state', 'sqlite_master'}
+    
+    def verify_query_plans(self) -> List[str]:
+        """用 EXPLAIN QUERY PLAN 检查各查询路径，发现全表扫描、临时排序或关键词 LIKE 匹配时返回问题列表
+        
+        以示例参数调用各查询方法，记录实际执行的 SQL 后逐条检查，因此方法中的
+        查询被修改后也会被检查到。tests/test_query_plans.py 以有代表性的数据调用本方法，
+        返回非空列表时测试失败：
+            python -m pytest tests/test_query_plans.py
+        
+        例外：
+        - 小表（PLAN_SMALL_TABLES）的扫描
+        - 全文索引匹配结果的排序（匹配集合很小，无法按 added_time 有序读取）
+        - 启动扫描时一次性加载全部记录的方法（如 get_quick_fingerprints）不在检查范围内
+        
+        Returns:
+            ["方法: 计划详情 -- SQL", ...]，没有问题时为空列表
+        """
+        keyword = "测试文字"
+        short_keyword = "测试"
+        checks = [
+            ('search_images', lambda: self.search_images(keyword, "积极")),
+            ('search_images', lambda: self.search_images("", "积极")),
+            ('search_images', lambda: self.search_images()),
+            ('get_images_count', lambda: self.get_images_count(processed=1)),
+            ('get_images_count', lambda: self.get_images_count(processed=1, keyword=keyword)),
+            ('get_images_count', lambda: self.get_images_count(processed=1, keyword=short_keyword)),
+            ('get_images_count', lambda: self.get_images_count(processed=1, emotion="积极")),
+            ('get_images_page', lambda: self.get_images_page(1, 20, processed=1)),
+            ('get_images_page', lambda: self.get_images_page(50, 20, processed=1, emotion="积极")),
+            ('get_images_page', lambda: self.get_images_page(3, 20, processed=1, keyword=keyword)),
+            ('get_images_page', lambda: self.get_images_page(1, 20, processed=1, keyword=short_keyword)),
+            ('get_images_after', lambda: self.get_images_after(("2000-01-01T00:00:00", 1), 20)),
+            ('get_emotion_facets', lambda: self.get_emotion_facets(1, keyword)),
+            ('get_emotion_facets', lambda: self.get_emotion_facets(1, short_keyword)),
+            ('get_emotion_facets', lambda: self.get_emotion_facets(1, "图")),
+            ('get_emotion_facets', lambda: self.get_emotion_facets(0)),
+            ('get_unprocessed_images', lambda: self.get_unprocessed_images(100)),
+            ('iter_unprocessed_images', lambda: list(self.iter_unprocessed_images())),
+            ('iter_processed_phashes', lambda: list(self.iter_processed_phashes())),
+            ('iter_images', lambda: list(self.iter_images(processed=1, emotion="积极"))),
+            ('get_image_hashes', lambda: self.get_image_hashes(1)),
+            ('get_file_manifest', lambda: self.get_file_manifest(1)),
+            ('get_manifest_slice', lambda: self.get_manifest_slice(100, 2000)),
+            ('get_dir_mtimes', lambda: self.get_dir_mtimes(1)),
+            ('get_orphan_images', lambda: self.get_orphan_images(1)),
+            ('get_unlinked_paths', lambda: self.get_unlinked_paths(1, ["hash"])),
+            ('get_processed_phashes', lambda: self.get_processed_phashes()),
+            ('get_profile_counts', lambda: self.get_profile_counts()),
+        ]
+        
+        problems = []
+        for name, call in checks:
+            self._query_log = []
+            try:
+                call()
+            finally:
+                queries, self._query_log = self._query_log, None
+            
+            for sql, params in queries:
+                with self.get_cursor() as cursor:
+                    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                    details = [row[3] for row in cursor.fetchall()]
+                
+                fulltext = any("VIRTUAL TABLE" in detail for detail in details)
+                if " LIKE " in sql:
+                    # 逐行匹配关键词：计划中显示为按索引读取，但要读完所有满足其他条件的行
+                    problems.append(f"{name}: 关键词未使用全文索引 -- {' '.join(sql.split())}")
+                for detail in details:
+                    words = detail.split()
+                    if words[0] == "SCAN" and "VIRTUAL TABLE" not in detail:
+                        table = words[2] if words[1] == "TABLE" else words[1]
+                        if table not in self.PLAN_SMALL_TABLES and table != "CONSTANT":
+                            problems.append(f"{name}: {detail} -- {' '.join(sql.split())}")
+                    elif "TEMP B-TREE" in detail and not fulltext:
+                        problems.append(f"{name}: {detail} -- {' '.join(sql.split())}")
+        
+        for problem in problems:
+            logger.warning(f"查询计划检查: {problem}")
+        return problems
+    
     def close(self):
-        """关闭数据库连接池"""
+        """提交剩余的写操作并关闭数据库连接"""
+        logger.info(f"数据库连接池统计: {self.pool.metrics()}")
         self.pool.close_all()
+        # 写连接最后关闭，关闭时执行检查点（只读连接无法执行）
+        self.writer.close()
         logger.info("数据库连接池已关闭")
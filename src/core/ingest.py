@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+图源入库模块 - 增量扫描图源并分批写入数据库
+- 手动扫描和实时监控共用同一入库流程
+- 同一时间只允许一个入库流程运行
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Tuple
+
+from .scanner import ImageScanner, FileManifest, FingerprintIndex, HashStats
+from .phash import dhash_files
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# 入库锁：手动扫描和实时监控不能同时处理同一数据库
+SCAN_LOCK = threading.RLock()
+
+# 每组计算感知哈希的图片数
+PHASH_CHUNK_SIZE = 64
+
+# 每次入库后递增，用于判断缓存的指纹索引是否过期
+_generation = 0
+
+
+def scan_generation() -> int:
+    """获取入库代数（每完成一次入库加一）"""
+    return _generation
+
+
+def backfill_fingerprints(db) -> int:
+    """为缺少快速指纹的图片（旧版本数据库中的记录）计算 (大小, 快速指纹)"""
+    rows = db.get_images_without_fingerprint()
+    if not rows:
+        return 0
+    
+    ids = {file_path: image_id for image_id, file_path in rows}
+    paths = [Path(file_path) for file_path in ids if os.path.exists(file_path)]
+    updates = []
+    for img_path, value in ImageScanner.hash_files(paths, quick=True):
+        if value.startswith("error_"):
+            continue
+        try:
+            file_size = img_path.stat().st_size
+        except OSError:
+            continue
+        updates.append((ids[str(img_path)], file_size, ImageScanner.quick_part(value)))
+    return db.update_fingerprints(updates)
+
+
+def _with_phash(rows: Iterable[Tuple]) -> Iterator[Tuple]:
+    """为待入库的图片分组并发计算感知哈希，追加到每行末尾"""
+    workers = ImageScanner.default_hash_workers()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= PHASH_CHUNK_SIZE:
+            yield from _phash_chunk(chunk, workers)
+            chunk = []
+    if chunk:
+        yield from _phash_chunk(chunk, workers)
+
+
+def _phash_chunk(chunk, workers: int) -> Iterator[Tuple]:
+    phashes = dhash_files((Path(row[0]) for row in chunk), workers=workers)
+    for row, phash in zip(chunk, phashes):
+        yield row + (phash,)
+
+
+def reconcile_moved(db, source_id: int) -> Tuple[int, int]:
+    """处理图源中已消失的文件
+    
+    清单中已没有对应文件的图片记录，若同一图源内有内容相同（file_hash 相同）
+    但尚无记录的新路径，视为移动/重命名，原地更新路径并保留识别结果；
+    没有匹配的记录批量删除。
+    
+    Returns:
+        (移动数, 删除数)
+    """
+    # 文件仍存在（如所在目录暂时无法读取）的记录保留
+    orphans = [(file_path, file_hash) for file_path, file_hash in db.get_orphan_images(source_id)
+               if not os.path.exists(file_path)]
+    if not orphans:
+        return 0, 0
+    
+    candidates = db.get_unlinked_paths(source_id, (file_hash for _, file_hash in orphans))
+    moves = []
+    deletes = []
+    for file_path, file_hash in orphans:
+        paths = candidates.get(file_hash)
+        if paths:
+            moves.append((file_path, paths.pop()))
+        else:
+            deletes.append(file_path)
+    
+    moved = db.move_images(moves)
+    deleted = db.remove_images_by_paths(deletes)
+    return moved, deleted
+
+
+def ingest_source(db, source_id: int, folder_path: str, fingerprints: FingerprintIndex,
+                  stats: HashStats = None, cancel: threading.Event = None,
+                  dirty_dirs: Iterable[str] = None,
+                  on_progress: Callable[[int], None] = None) -> int:
+    """增量扫描单个图源并分批写入数据库
+    
+    新文件插入 images 表（即进入待处理队列），内容变化的文件重置为未处理，
+    移动/重命名的文件更新路径，已删除的文件从 images 表中移除。每批提交后同时保存文件/目录状态清单，
+    中断后重新扫描会从中断处继续。
+    
+    Args:
+        db: ImageDatabase
+        source_id: 图源ID
+        folder_path: 图源文件夹
+        fingerprints: 快速指纹索引（会被原地更新）
+        stats: 扫描统计对象
+        cancel: 取消事件
+        dirty_dirs: 已知发生变化的目录（如监控事件），即使 mtime 未变也会重新列出
+        on_progress: 每批提交后的回调 on_progress(本次累计新增数)
+    
+    Returns:
+        新增或内容变化的图片数
+    """
+    global _generation
+    
+    with SCAN_LOCK:
+        # 旧版本数据库中的记录先补充快速指纹并登记到索引，否则比较时大文件会得到与已存
+        # 完整哈希不同的 "q:" 哈希，被当作内容变化而重置识别结果
+        if backfill_fingerprints(db):
+            for quick_hash, (file_path, file_hash) in db.get_quick_fingerprints().items():
+                fingerprints.add(quick_hash, file_path, file_hash)
+        
+        # 获取已存在的图片哈希
+        existing_hashes = db.get_image_hashes(source_id)
+        
+        # 加载文件/目录状态清单，未变化的目录不再列出、未变化的文件不再重新计算哈希
+        manifest = FileManifest(db.get_file_manifest(source_id), db.get_dir_mtimes(source_id))
+        for dir_path in dirty_dirs or ():
+            if dir_path in manifest.dir_mtimes:
+                manifest.invalidate_dir(dir_path)
+        
+        def _flush(added: int, seen: int):
+            # 每批图片提交后保存清单变更，作为断点
+            db.upgrade_file_hashes(fingerprints.pending())
+            fingerprints.clear_pending()
+            entries, removed = manifest.pending()
+            db.save_file_manifest(source_id, entries, removed)
+            db.save_dir_mtimes(source_id, *manifest.pending_dirs())
+            manifest.clear_pending()
+            if on_progress:
+                on_progress(added)
+        
+        # 边扫描边分批写入数据库
+        new_images = ImageScanner.iter_new_images(folder_path, existing_hashes, manifest,
+                                                  stats=stats, fingerprints=fingerprints,
+                                                  cancel=cancel)
+        rows = ((str(img_path), img_hash, source_id, file_size, quick_hash)
+                for img_path, img_hash, file_size, quick_hash in new_images)
+        added = db.add_images_stream(_with_phash(rows), on_batch=_flush)
+        
+        # 保存剩余的清单变更
+        _flush(added, 0)
+        
+        if cancel is None or not cancel.is_set():
+            # 扫描完整结束后才处理已消失的文件：其新位置可能在之后的目录中
+            reconcile_moved(db, source_id)
+            db.update_scan_time(source_id)
+        
+        _generation += 1
+    
+    return added
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多进程OCR模块 - 每个工作进程加载自己的 PaddleOCR，多核并行识别
+- 每个进程限制推理线程数，避免多个进程争抢CPU
+- 工作进程数按CPU核数和可用内存自动确定
+- 调度方（界面线程）负责领取图片、分发给工作进程并写回结果，工作进程不访问数据库
+- 支持 forkserver 的系统（Linux/macOS）上，由 fork 服务进程加载一次模型，
+  工作进程从它 fork 而来，以写时复制方式共享模型内存，启动几乎无需等待
+"""
+
+import gc
+import os
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+from utils.resource_monitor import get_resource_monitor
+
+logger = get_logger()
+
+# 每个工作进程（PaddleOCR 模型 + 推理缓存）的预估内存占用（MB）
+WORKER_MEMORY_MB = 1500
+# 从 fork 服务进程 fork 出的工作进程共享模型，只需计算私有的推理缓存（MB）
+FORKED_WORKER_MEMORY_MB = 600
+
+
+# fork 服务进程预加载模型时读取的配置（"use_gpu,threads,batch_size,profile"），只在启动 fork 服务进程期间设置
+PRELOAD_ENV = 'MEMEFINDER_OCR_PRELOAD'
+
+# 工作进程中的 OCR 处理器（由 _init_worker 创建，或从 fork 服务进程继承）
+_processor = None
+
+
+def _load_processor(use_gpu: bool, threads: int, batch_size: int, profile: str):
+    """限制推理线程数后加载模型"""
+    global _processor
+    # 必须在导入 paddle 之前设置
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    from .ocr_processor import OCRProcessor
+    _processor = OCRProcessor(use_gpu=use_gpu, batch_size=batch_size, cpu_threads=threads, profile=profile)
+
+
+def _preload():
+    """fork 服务进程导入本模块时加载模型，之后 fork 出的工作进程直接继承
+
+    只加载、不推理：推理会启动 OpenMP/oneDNN 线程池，在已有这些线程的进程中 fork，
+    子进程可能死锁（与不从界面进程 fork 的原因相同）。预热在各工作进程中进行。
+    """
+    config = os.environ.get(PRELOAD_ENV)
+    if not config or _processor is not None:
+        return
+    try:
+        use_gpu, threads, batch_size, profile = config.split(',')
+        _load_processor(bool(int(use_gpu)), int(threads), int(batch_size), profile)
+        # 把已有对象移出垃圾回收的跟踪范围，避免子进程中的回收扫描改写共享页面
+        gc.freeze()
+        logger.info("fork 服务进程已预加载OCR模型")
+    except Exception as e:
+        # 预加载失败时工作进程会在 _init_worker 中各自加载
+        logger.error(f"fork 服务进程预加载OCR模型失败: {e}")
+
+
+def _init_worker(use_gpu: bool, threads: int, batch_size: int, profile: str):
+    """工作进程初始化：已从 fork 服务进程继承同一档位的模型时无需再加载，预热后开始接收任务"""
+    if _processor is None or _processor.profile != profile:
+        _load_processor(use_gpu, threads, batch_size, profile)
+    _processor.warm_up()
+
+
+def _process_chunk(paths: List[str]) -> List[Dict[str, Any]]:
+    """在工作进程中识别一组图片"""
+    return _processor.process_batch([Path(p) for p in paths])
+
+
+class OCRWorkerPool:
+    """多进程OCR工作池
+
+    process_batch 与 OCRProcessor.process_batch 接口相同：把图片按 batch_size 分组，
+    同时分发给所有工作进程，按输入顺序返回结果。可以从多个线程同时调用。
+    """
+
+    def __init__(self, profile: str, workers: int = None, threads_per_worker: int = 2,
+                 batch_size: int = 8, use_gpu: bool = False, start_method: str = None):
+        """
+        Args:
+            profile: 识别档位（见 OCRProcessor.PROFILES），由调用方指定
+            workers: 工作进程数，None 表示自动（见 default_workers）
+            threads_per_worker: 每个进程的推理线程数
+            batch_size: 每个进程每次识别的图片数
+            use_gpu: 是否使用GPU（多个进程共用同一块GPU）
+            start_method: 'forkserver' 或 'spawn'，None 表示自动（见 default_start_method）
+        """
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.start_method = self._check_start_method(start_method or self.default_start_method(use_gpu))
+        self.workers = workers or self.default_workers(self.threads_per_worker, use_gpu, self.start_method)
+        self.batch_size = max(1, batch_size)
+        self.use_gpu = use_gpu
+        self.profile = profile
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_start_method(use_gpu: bool = False) -> str:
+        """默认启动方式：支持时使用 forkserver（共享预加载的模型），否则（Windows、使用GPU）使用 spawn"""
+        # CUDA 上下文不能跨 fork 使用
+        if not use_gpu and 'forkserver' in multiprocessing.get_all_start_methods():
+            return 'forkserver'
+        return 'spawn'
+
+    @staticmethod
+    def _check_start_method(start_method: str) -> str:
+        if start_method not in ('forkserver', 'spawn'):
+            raise ValueError(f"不支持的启动方式: {start_method}")
+        if start_method not in multiprocessing.get_all_start_methods():
+            logger.warning(f"当前系统不支持 {start_method}，改用 spawn")
+            return 'spawn'
+        return start_method
+
+    @staticmethod
+    def default_workers(threads_per_worker: int = 2, use_gpu: bool = False,
+                        start_method: str = 'spawn') -> int:
+        """按CPU核数和可用内存确定工作进程数（使用GPU时为1）"""
+        if use_gpu:
+            return 1
+        by_cpu = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+        try:
+            available_mb = get_resource_monitor().get_system_memory()['available_mb']
+            if start_method == 'forkserver':
+                # 模型只在 fork 服务进程中加载一份
+                available_mb -= WORKER_MEMORY_MB
+                per_worker_mb = FORKED_WORKER_MEMORY_MB
+            else:
+                per_worker_mb = WORKER_MEMORY_MB
+            by_memory = max(1, int(available_mb // per_worker_mb))
+        except Exception:
+            by_memory = by_cpu
+        return min(by_cpu, by_memory)
+
+    def start(self):
+        """启动工作进程
+
+        spawn 方式下各进程分别加载模型，需要一段时间；forkserver 方式下只在 fork 服务进程中
+        加载一次，之后的工作进程由它 fork 而来，只需各自预热。
+        """
+        with self._lock:
+            return self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        if self._executor is not None:
+            return self._executor
+        context = multiprocessing.get_context(self.start_method)
+        if self.start_method == 'forkserver':
+            self._start_fork_server(context)
+        # 不直接从本进程 fork：界面进程已有多个线程（数据库写入、监控等），fork 后子进程可能死锁
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.use_gpu, self.threads_per_worker, self.batch_size, self.profile),
+        )
+        logger.info(f"启动OCR工作进程: {self.workers} 个 (每个 {self.threads_per_worker} 线程, "
+                    f"启动方式: {self.start_method})")
+        return self._executor
+
+    def _start_fork_server(self, context):
+        """启动 fork 服务进程并让它导入本模块，导入时按 PRELOAD_ENV 加载模型
+
+        fork 服务进程在整个程序中只有一个，已在运行时沿用其中已加载的模型
+        （档位不同时由 _init_worker 在工作进程中重新加载）。
+        """
+        from multiprocessing import forkserver
+        context.set_forkserver_preload([__name__])
+        os.environ[PRELOAD_ENV] = f"{int(self.use_gpu)},{self.threads_per_worker},{self.batch_size},{self.profile}"
+        try:
+            forkserver.ensure_running()
+        finally:
+            del os.environ[PRELOAD_ENV]
+
+    def process_batch(self, image_paths: List[Path]) -> List[Dict[str, Any]]:
+        """并行识别多张图片，按输入顺序返回结果（格式同 OCRProcessor.process_image）"""
+        executor = self.start()
+        paths = [str(p) for p in image_paths]
+        chunks = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        try:
+            futures = [executor.submit(_process_chunk, chunk) for chunk in chunks]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        except BrokenProcessPool:
+            # 工作进程异常退出（如内存不足被系统结束），下次调用时重新启动
+            with self._lock:
+                # 其他线程可能已经重新启动了工作池
+                if self._executor is executor:
+                    logger.error("OCR工作进程异常退出，将重新启动")
+                    self._executor = None
+                    executor.shutdown(wait=False)
+            raise
+
+    def shutdown(self, wait: bool = True):
+        """停止所有工作进程"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            logger.info("OCR工作进程已停止")
+
+
+_preload()
@@ -6,7 +6,6 @@
 """
 
 import re
-import tempfile
 import gc
 import os
 from pathlib import Path
@@ -41,19 +40,57 @@ resource_monitor = get_resource_monitor()
 class OCRProcessor:
     """OCR处理器 - 与 ocr_cli.py 完全兼容的实现（优化版）"""
 
-    def __init__(self, lang: str = 'ch', use_gpu: bool = False, det_side: int = 1536, use_senta: bool = True):
+    # 一批外扩画布的像素总数上限（约 48MB BGR 数据），大图较多时自动减少每批张数
+    MAX_BATCH_PIXELS = 16_000_000
+    # 系统内存使用率超过此值时减半批大小，低于 BATCH_GROW_PERCENT 时逐步恢复
+    BATCH_SHRINK_PERCENT = 80.0
+    BATCH_GROW_PERCENT = 60.0
+
+    # 识别档位：在速度和准确率之间取舍，档位名称随识别结果记录在 images.ocr_profile 中
+    # - doc_orientation / doc_unwarping：整图方向分类和文本图像矫正，针对拍摄的文档，表情包基本用不到且开销较大
+    # - textline_orientation：文本行方向分类（识别倒置的文字）
+    # - det_model / rec_model：检测/识别模型，None 使用 PaddleOCR 默认的 server 模型，mobile 模型更快但精度略低
+    # - det_side：检测时图片最长边的上限
+    PROFILES = {
+        'fast': {
+            'doc_orientation': False, 'doc_unwarping': False, 'textline_orientation': False,
+            'det_model': 'PP-OCRv5_mobile_det', 'rec_model': 'PP-OCRv5_mobile_rec', 'det_side': 960,
+        },
+        'balanced': {
+            'doc_orientation': False, 'doc_unwarping': False, 'textline_orientation': True,
+            'det_model': None, 'rec_model': None, 'det_side': 1280,
+        },
+        'accurate': {
+            'doc_orientation': True, 'doc_unwarping': True, 'textline_orientation': True,
+            'det_model': None, 'rec_model': None, 'det_side': 1536,
+        },
+    }
+    # 默认档位与引入档位之前的配置一致（未记录档位的旧数据即按此识别）
+    DEFAULT_PROFILE = 'accurate'
+
+    def __init__(self, lang: str = 'ch', use_gpu: bool = False, det_side: int = None, use_senta: bool = True,
+                 batch_size: int = 8, cpu_threads: int = None, profile: str = None):
         """
         初始化OCR处理器
 
         Args:
             lang: 语言，默认'ch'（中文）
             use_gpu: 是否使用GPU
-            det_side: 检测侧边长度，默认1536（可降低以减少内存）
+            det_side: 检测侧边长度，None 使用档位的设置（可降低以减少内存）
             use_senta: 是否使用情绪分析模型，默认True（优先使用 SnowNLP，快速且准确）
+            batch_size: process_batch 每次送入 predict 的最大图片数（会根据内存自动调整）
+            cpu_threads: CPU 推理线程数，None 使用 PaddleOCR 默认值（多进程时应限制）
+            profile: 识别档位 'fast'/'balanced'/'accurate'（见 PROFILES），None 使用 DEFAULT_PROFILE
         """
         logger.info("=" * 60)
         logger.info("初始化 OCR 处理器...")
         
+        self.profile = profile or self.DEFAULT_PROFILE
+        if self.profile not in self.PROFILES:
+            raise ValueError(f"未知的识别档位: {self.profile}")
+        options = self.PROFILES[self.profile]
+        det_side = det_side or options['det_side']
+
         self.lang = lang
         self.det_side = det_side
         
@@ -61,9 +98,11 @@ class OCRProcessor:
         self._process_count = 0
         self._gc_interval = 10  # 每处理10张图片执行一次垃圾回收
 
-        # 处理计数器（用于定期清理内存）
-        self._process_count = 0
-        self._gc_interval = 10  # 每处理10张图片执行一次垃圾回收
+        # 批处理大小：batch_size 为上限，_batch_limit 为根据内存调整后的当前值，
+        # 出现过 MemoryError 后不再超过 _batch_ceiling
+        self.batch_size = max(1, batch_size)
+        self._batch_limit = self.batch_size
+        self._batch_ceiling = self.batch_size
 
         # 设置设备（智能选择）
         device_name, actually_using_gpu = self._setup_device(use_gpu)
@@ -75,12 +114,20 @@ class OCRProcessor:
         # 初始化OCR（与 ocr_cli.py 完全一致的配置）
         # 注意：新版本 PaddleOCR 不再接受 use_gpu 参数
         # 设备选择已通过 paddle.set_device() 和环境变量控制
-        logger.info(f"正在初始化 PaddleOCR (lang={lang}, det_side={det_side})...")
+        logger.info(f"正在初始化 PaddleOCR (lang={lang}, profile={self.profile}, det_side={det_side})...")
+        extra_options = {}
+        if cpu_threads:
+            extra_options['cpu_threads'] = cpu_threads
+        if options['det_model']:
+            extra_options['text_detection_model_name'] = options['det_model']
+        if options['rec_model']:
+            extra_options['text_recognition_model_name'] = options['rec_model']
         self.ocr = PaddleOCR(
+            **extra_options,
             lang=lang,
-            use_textline_orientation=True,
-            use_doc_orientation_classify=True,
-            use_doc_unwarping=True,
+            use_textline_orientation=options['textline_orientation'],
+            use_doc_orientation_classify=options['doc_orientation'],
+            use_doc_unwarping=options['doc_unwarping'],
             text_det_limit_side_len=det_side,
             text_det_limit_type="max",
             text_det_box_thresh=0.30,
@@ -226,17 +273,7 @@ class OCRProcessor:
             }
         """
         try:
-            # 定期执行垃圾回收以释放内存
-            self._process_count += 1
-            if self._process_count % self._gc_interval == 0:
-                freed = resource_monitor.force_garbage_collection()
-                logger.debug(f"已处理 {self._process_count} 张图片，执行垃圾回收")
-            
-            # 检查内存使用情况
-            if self._process_count % 5 == 0:
-                mem_usage = resource_monitor.get_memory_usage()
-                logger.debug(f"当前内存使用: {mem_usage['rss_mb']:.2f} MB ({mem_usage['percent']:.1f}%)")
-            
+            self._count_processed(1)
             logger.debug(f"开始处理图片: {image_path.name}")
             
             # 1. OCR识别（使用 ocr_cli.py 的实现）
@@ -247,41 +284,237 @@ class OCRProcessor:
                 logger.error(f"OCR结果格式错误，期望dict，得到{type(ocr_result)}")
                 ocr_result = {'items': []}
             
-            items = ocr_result.get('items', [])
-            items_count = len(items)
-            logger.debug(f"OCR识别完成，识别到 {items_count} 个文本区域")
-
-            # 2. 提取文本
-            ocr_text = self._extract_text(items)
-            logger.debug(f"OCR文本提取完成，提取到 {len(ocr_text)} 字符")
-            if ocr_text:
-                logger.debug(f"提取的文本预览: {ocr_text[:100]}")
-
-            # 3. 过滤文本
-            filtered_text = self.filter_text(ocr_text)
-            if filtered_text:
-                logger.debug(f"文本过滤完成: {filtered_text[:50]}...")
-
-            # 4. 情绪分析
-            emotion, pos_score, neg_score = self.analyze_emotion(filtered_text)
-            logger.debug(f"情绪分析: {emotion} (正:{pos_score:.2f}, 负:{neg_score:.2f})")
-
-            return {
-                'ocr_text': ocr_text,
-                'filtered_text': filtered_text,
-                'emotion': emotion,
-                'emotion_positive': pos_score,
-                'emotion_negative': neg_score
-            }
+            return self.build_result(ocr_result.get('items', []))
         except Exception as e:
             logger.error(f"处理图片失败 {image_path}: {e}")
-            return {
-                'ocr_text': '',
-                'filtered_text': '',
-                'emotion': '未分类',
-                'emotion_positive': 0.0,
-                'emotion_negative': 0.0
-            }
+            return self._empty_result()
+
+    def process_batch(self, image_paths: List[Path], pad_ratio: float = 0.10) -> List[Dict[str, Any]]:
+        """
+        批量处理图片：分批解码并外扩，每批调用一次 predict，再逐张过滤文本、分析情绪
+
+        每批最多 batch_size 张、画布像素总数不超过 MAX_BATCH_PIXELS；系统内存紧张或
+        出现 MemoryError 时批大小减半，内存充足时逐步恢复。单张图片失败不影响同批其他图片。
+
+        Args:
+            image_paths: 图片路径列表
+            pad_ratio: 画布外扩比例，默认0.10
+
+        Returns:
+            与 image_paths 顺序一致的结果列表，每项格式同 process_image
+        """
+        count = len(image_paths)
+        results: List[Dict[str, Any]] = [None] * count
+        carry = None  # 超出像素上限、留到下一批的已解码图片
+        index = 0
+        while index < count or carry is not None:
+            self._adapt_batch_limit()
+
+            # 解码并外扩一批图片（解码失败的图片直接得到空结果）
+            batch = [carry] if carry is not None else []
+            pixels = sum(entry[2].shape[0] * entry[2].shape[1] for entry in batch)
+            carry = None
+            while index < count and len(batch) < self._batch_limit:
+                img_path = Path(image_paths[index])
+                try:
+                    canvas, offset, orig_wh = self._make_padded_array(img_path, pad_ratio)
+                except Exception as e:
+                    logger.error(f"处理图片失败 {img_path}: {e}")
+                    results[index] = self._empty_result()
+                    index += 1
+                    continue
+                entry = (index, img_path, canvas, offset, orig_wh)
+                index += 1
+                size = canvas.shape[0] * canvas.shape[1]
+                if batch and pixels + size > self.MAX_BATCH_PIXELS:
+                    carry = entry
+                    break
+                pixels += size
+                batch.append(entry)
+            if not batch:
+                continue
+
+            try:
+                items_list = self._ocr_batch(batch)
+            except MemoryError:
+                if len(batch) == 1:
+                    logger.error(f"处理图片失败 {batch[0][1]}: 内存不足")
+                    results[batch[0][0]] = self._empty_result()
+                    continue
+                # 内存不足：批大小减半，从本批第一张重新开始
+                self._batch_limit = self._batch_ceiling = max(1, len(batch) // 2)
+                logger.warning(f"批量识别内存不足，批大小降为 {self._batch_limit}")
+                index = batch[0][0]
+                carry = None
+                del batch
+                gc.collect()
+                continue
+
+            for (i, img_path, _, offset, orig_wh), items in zip(batch, items_list):
+                try:
+                    results[i] = self.build_result(self._shift_items_to_original(items, *offset, orig_wh))
+                except Exception as e:
+                    logger.error(f"处理图片失败 {img_path}: {e}")
+                    results[i] = self._empty_result()
+            self._count_processed(len(batch))
+            del batch
+
+        return results
+
+    def _ocr_batch(self, batch: List[Tuple]) -> List[List[Dict[str, Any]]]:
+        """一次 predict 识别一批外扩画布，返回每张图的文本区域（外扩坐标）
+
+        批量调用失败（MemoryError 除外）时回退为逐张识别。
+        """
+        if not batch:
+            return []
+        if len(batch) > 1:
+            try:
+                outputs = list(self.ocr.predict([canvas for _, _, canvas, _, _ in batch]))
+                if len(outputs) == len(batch):
+                    items_list = []
+                    for (_, img_path, _, _, _), res in zip(batch, outputs):
+                        try:
+                            # 与单张 predict 返回的结果列表形式一致
+                            items_list.append(self._parse_ocr_result([res], img_path))
+                        except Exception as e:
+                            logger.error(f"OCR结果解析失败: {e}")
+                            items_list.append([])
+                    return items_list
+                logger.debug(f"批量 predict 返回 {len(outputs)} 个结果，期望 {len(batch)} 个，改为逐张识别")
+            except MemoryError:
+                raise
+            except Exception as e:
+                logger.debug(f"批量 predict 失败，改为逐张识别: {e}")
+
+        return [self._ocr_single(img_path, canvas).get("items", [])
+                for _, img_path, canvas, _, _ in batch]
+
+    # ==================== 流水线分阶段接口 ====================
+    # 解码、识别、文本后处理可分别在不同线程中执行（见 core/pipeline.py）
+
+    def decode_image(self, img_path: Path, pad_ratio: float = 0.10) -> Tuple:
+        """解码图片并外扩画布，返回 (画布, 偏移, 原图尺寸)，供 recognize_batch 使用"""
+        return self._make_padded_array(img_path, pad_ratio)
+
+    def current_batch_limit(self) -> int:
+        """根据系统内存调整后，当前每批最多识别的图片数"""
+        self._adapt_batch_limit()
+        return self._batch_limit
+
+    def recognize_batch(self, entries: List[Tuple]) -> List[List[Dict[str, Any]]]:
+        """识别一批已外扩的画布，返回每张图的文本区域（原图坐标）
+
+        Args:
+            entries: [(图片路径, 画布, 偏移, 原图尺寸), ...]，后三项即 decode_image 的返回值
+
+        按 batch_size 和 MAX_BATCH_PIXELS 分组调用 predict；出现 MemoryError 时批大小减半后重试。
+        """
+        results: List[List[Dict[str, Any]]] = []
+        start = 0
+        while start < len(entries):
+            group = []
+            pixels = 0
+            for i in range(start, len(entries)):
+                img_path, canvas, offset, orig_wh = entries[i]
+                size = canvas.shape[0] * canvas.shape[1]
+                if group and (len(group) >= self._batch_limit or pixels + size > self.MAX_BATCH_PIXELS):
+                    break
+                group.append((i, img_path, canvas, offset, orig_wh))
+                pixels += size
+
+            try:
+                items_list = self._ocr_batch(group)
+            except MemoryError:
+                if len(group) > 1:
+                    self._batch_limit = self._batch_ceiling = max(1, len(group) // 2)
+                    logger.warning(f"批量识别内存不足，批大小降为 {self._batch_limit}")
+                    del group
+                    gc.collect()
+                    continue
+                logger.error(f"处理图片失败 {group[0][1]}: 内存不足")
+                items_list = [[]]
+
+            for (_, img_path, _, offset, orig_wh), items in zip(group, items_list):
+                try:
+                    results.append(self._shift_items_to_original(items, *offset, orig_wh))
+                except Exception as e:
+                    logger.error(f"处理图片失败 {img_path}: {e}")
+                    results.append([])
+            self._count_processed(len(group))
+            start += len(group)
+
+        return results
+
+    def _adapt_batch_limit(self):
+        """根据系统内存使用率调整批大小"""
+        percent = resource_monitor.get_system_memory()['percent']
+        if percent > self.BATCH_SHRINK_PERCENT and self._batch_limit > 1:
+            self._batch_limit = max(1, self._batch_limit // 2)
+            logger.warning(f"系统内存使用率 {percent:.1f}%，批大小降为 {self._batch_limit}")
+        elif percent < self.BATCH_GROW_PERCENT and self._batch_limit < min(self.batch_size, self._batch_ceiling):
+            self._batch_limit += 1
+
+    def _count_processed(self, count: int):
+        """累计处理张数，定期执行垃圾回收并记录内存使用"""
+        before = self._process_count
+        self._process_count += count
+        # 定期执行垃圾回收以释放内存
+        if self._process_count // self._gc_interval > before // self._gc_interval:
+            resource_monitor.force_garbage_collection()
+            logger.debug(f"已处理 {self._process_count} 张图片，执行垃圾回收")
+        
+        # 检查内存使用情况
+        if self._process_count // 5 > before // 5:
+            mem_usage = resource_monitor.get_memory_usage()
+            logger.debug(f"当前内存使用: {mem_usage['rss_mb']:.2f} MB ({mem_usage['percent']:.1f}%)")
+
+    def build_result(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """由文本区域得到最终结果：提取文本、过滤、情绪分析"""
+        logger.debug(f"OCR识别完成，识别到 {len(items)} 个文本区域")
+
+        # 2. 提取文本
+        ocr_text = self._extract_text(items)
+        logger.debug(f"OCR文本提取完成，提取到 {len(ocr_text)} 字符")
+        if ocr_text:
+            logger.debug(f"提取的文本预览: {ocr_text[:100]}")
+
+        # 3. 过滤文本
+        filtered_text = self.filter_text(ocr_text)
+        if filtered_text:
+            logger.debug(f"文本过滤完成: {filtered_text[:50]}...")
+
+        # 4. 情绪分析
+        emotion, pos_score, neg_score = self.analyze_emotion(filtered_text)
+        logger.debug(f"情绪分析: {emotion} (正:{pos_score:.2f}, 负:{neg_score:.2f})")
+
+        return {
+            'ocr_text': ocr_text,
+            'filtered_text': filtered_text,
+            'emotion': emotion,
+            'emotion_positive': pos_score,
+            'emotion_negative': neg_score
+        }
+
+    @staticmethod
+    def _empty_result() -> Dict[str, Any]:
+        """处理失败时的结果"""
+        return {
+            'ocr_text': '',
+            'filtered_text': '',
+            'emotion': '未分类',
+            'emotion_positive': 0.0,
+            'emotion_negative': 0.0
+        }
+
+    def warm_up(self):
+        """用一张空白图片完整运行一次识别流程，提前完成推理引擎的延迟初始化和内存分配"""
+        blank = np.full((64, 256, 3), 255, dtype=np.uint8)
+        try:
+            self._ocr_single(Path("warm_up.png"), blank)
+            self.analyze_emotion("预热")
+        except Exception as e:
+            logger.warning(f"OCR预热失败: {e}")
 
     # ==================== OCR识别核心功能（来自 ocr_cli.py）====================
 
@@ -292,58 +525,51 @@ class OCRProcessor:
         Returns:
             {"image": "...", "items": [{"box":[[x,y]x4], "text":"...", "score":0.xx}, ...]}
         """
-        td_ctx = None
-        try:
-            # 创建外扩图片
-            td_ctx, feed_path, (px, py), (orig_w, orig_h) = self._make_padded_tmp(
-                img_path, pad_ratio
-            )
-
-            # OCR识别
-            result = self._ocr_single(feed_path)
-            
-            # 确保result是字典
-            if not isinstance(result, dict):
-                logger.error(f"OCR结果格式错误，期望dict，得到{type(result)}")
-                result = {"image": str(img_path), "items": []}
+        # 创建外扩画布（内存中，不写临时文件）
+        canvas, (px, py), (orig_w, orig_h) = self._make_padded_array(img_path, pad_ratio)
 
-            # 坐标回退到原图
-            items = self._shift_items_to_original(
-                result.get("items", []), px, py, (orig_w, orig_h)
-            )
-
-            return {"image": str(img_path), "items": items}
+        # OCR识别
+        result = self._ocr_single(img_path, canvas)
+        del canvas
+        
+        # 确保result是字典
+        if not isinstance(result, dict):
+            logger.error(f"OCR结果格式错误，期望dict，得到{type(result)}")
+            result = {"image": str(img_path), "items": []}
+
+        # 坐标回退到原图
+        items = self._shift_items_to_original(
+            result.get("items", []), px, py, (orig_w, orig_h)
+        )
 
-        finally:
-            if td_ctx is not None:
-                td_ctx.cleanup()
+        return {"image": str(img_path), "items": items}
 
-    def _make_padded_tmp(self, img_path: Path, pad_ratio: float, pad_color=(0, 0, 0)) -> Tuple:
-        """创建外扩的临时图片（与 ocr_cli.py 一致，优化内存使用）"""
+    def _make_padded_array(self, img_path: Path, pad_ratio: float, pad_color=(0, 0, 0)) -> Tuple:
+        """在内存中创建外扩画布（BGR 数组，可直接传给 PaddleOCR）
+        
+        外扩尺寸与原先保存临时 PNG 的实现一致，PNG 为无损格式，
+        因此 OCR 看到的像素和回退后的坐标都完全相同，只是省去了编码、写盘和再次解码。
+        
+        Returns:
+            (画布数组, (px, py), (原图宽, 原图高))
+        """
         # 使用 Image.open 上下文管理器，自动关闭文件
         with Image.open(img_path) as img:
             # 转换为RGB（如果需要）
             if img.mode != "RGB":
                 img = img.convert("RGB")
-            
-            w, h = img.size
-
-            if pad_ratio <= 0:
-                return None, img_path, (0, 0), (w, h)
-
-            px = max(1, int(round(w * pad_ratio)))
-            py = max(1, int(round(h * pad_ratio)))
-            canvas = Image.new("RGB", (w + 2 * px, h + 2 * py), pad_color)
-            canvas.paste(img, (px, py))
-
-            td = tempfile.TemporaryDirectory()
-            outp = Path(td.name) / f"{img_path.stem}.padded.png"
-            canvas.save(outp)
-            
-            # 显式释放canvas
-            del canvas
+            # PaddleOCR 与 OpenCV 一样使用 BGR 通道顺序
+            image = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+        
+        h, w = image.shape[:2]
+        if pad_ratio <= 0:
+            return image, (0, 0), (w, h)
 
-        return td, outp, (px, py), (w, h)
+        px = max(1, int(round(w * pad_ratio)))
+        py = max(1, int(round(h * pad_ratio)))
+        # pad_color 为 RGB，转为 BGR
+        canvas = cv2.copyMakeBorder(image, py, py, px, px, cv2.BORDER_CONSTANT, value=tuple(pad_color[::-1]))
+        return canvas, (px, py), (w, h)
 
     def _shift_items_to_original(self, items: List[Dict[str, Any]], dx: int, dy: int, orig_wh=None) -> List[Dict[str, Any]]:
         """将坐标回退到原图（与 ocr_cli.py 一致）"""
@@ -358,24 +584,29 @@ class OCRProcessor:
 
         return shifted
 
-    def _ocr_single(self, img_path: Path) -> Dict[str, Any]:
+    def _ocr_single(self, img_path: Path, image: np.ndarray = None) -> Dict[str, Any]:
         """
         单张图片OCR识别（与 ocr_cli.py 完全一致）
 
+        Args:
+            img_path: 图片路径（image 为 None 时从该路径读取）
+            image: 已解码的 BGR 图片数组
+
         Returns:
             {"image": "...", "items": [{"box":[[x,y]x4], "text":"...", "score":0.xx}, ...]}
         """
         res = None
         error_msg = None
+        feed = image if image is not None else str(img_path)
         
         try:
             # 尝试使用 predict 方法
             try:
-                res = self.ocr.predict(str(img_path))
+                res = self.ocr.predict(feed)
                 logger.debug(f"OCR predict方法成功，结果类型: {type(res)}")
             except TypeError as e:
                 logger.debug(f"OCR predict需要列表参数，尝试转换: {e}")
-                tmp = self.ocr.predict([str(img_path)])
+                tmp = self.ocr.predict([feed])
                 res = tmp[0] if isinstance(tmp, (list, tuple)) and len(tmp) == 1 else tmp
             except Exception as e:
                 error_msg = f"predict方法失败: {e}"
@@ -389,7 +620,7 @@ class OCRProcessor:
         if not res:
             try:
                 logger.debug("尝试使用ocr方法...")
-                res = self.ocr.ocr(str(img_path))
+                res = self.ocr.ocr(feed)
                 logger.debug(f"OCR ocr方法成功，结果类型: {type(res)}")
             except Exception as e:
                 error_msg = f"ocr方法失败: {e}"
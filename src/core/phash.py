@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+感知哈希模块 - 识别重新保存/压缩/缩放过的相似图片
+- dHash：缩放为 9x8 灰度图，比较相邻像素亮度，得到 64 位整数
+- BK 树：按汉明距离建立索引，支持"距离不超过 r 的所有哈希"查询
+- 二次校验：64 位哈希相近的图片还需宽高比一致、16x16 细节哈希相近，才视为同一张图
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+
+logger = get_logger()
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# 认为是"同一张图"的最大汉明距离（64 位中）。
+# 表情包常见"同模板不同文字"，距离过大会把不同文字的图片误判为相同，因此取值保守
+NEAR_DUP_RADIUS = 2
+
+# 二次校验：宽高比的最大相对误差；细节哈希的边长及最大汉明距离（256 位中）。
+# 同模板不同文字的图片 9x8 哈希可能几乎相同，但文字区域在 16x16 哈希中会产生大量差异
+ASPECT_TOLERANCE = 0.02
+DETAIL_HASH_SIZE = 16
+DETAIL_RADIUS = 10
+
+_SIGN_BIT = 1 << 63
+
+
+def to_signed(value: int) -> int:
+    """无符号 64 位整数转为有符号（SQLite INTEGER 为有符号 64 位）"""
+    return value - (1 << 64) if value & _SIGN_BIT else value
+
+
+def to_unsigned(value: int) -> int:
+    """有符号 64 位整数转回无符号"""
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+def hamming(a: int, b: int) -> int:
+    """两个 64 位哈希的汉明距离"""
+    return bin(to_unsigned(a ^ b)).count("1")
+
+
+def dhash(img_path: Path) -> Optional[int]:
+    """计算图片的 dHash（有符号 64 位整数，可直接存入 SQLite）
+
+    Returns:
+        哈希值，无法读取或未安装 Pillow 时返回 None
+    """
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(img_path) as img:
+            # 只需要很小的尺寸，draft 可让 JPEG 解码时直接缩小
+            img.draft("L", (64, 64))
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.debug(f"计算感知哈希失败 {img_path}: {e}")
+        return None
+
+    return to_signed(_gradient_bits(pixels, 8))
+
+
+def _gradient_bits(pixels: List[int], size: int) -> int:
+    """(size+1) x size 灰度像素中相邻像素的亮度比较结果，按行拼接为整数"""
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def detail_hash(img_path: Path) -> Optional[Tuple[float, int]]:
+    """计算二次校验用的 (宽高比, 16x16 dHash)，无法读取时返回 None"""
+    if not PIL_AVAILABLE:
+        return None
+    size = DETAIL_HASH_SIZE
+    try:
+        with Image.open(img_path) as img:
+            width, height = img.size
+            img.draft("L", (size * 8, size * 8))
+            pixels = list(img.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.debug(f"计算细节哈希失败 {img_path}: {e}")
+        return None
+    if not width or not height:
+        return None
+    return width / height, _gradient_bits(pixels, size)
+
+
+def same_image(a: Optional[Tuple[float, int]], b: Optional[Tuple[float, int]]) -> bool:
+    """根据 detail_hash 的结果判断两张图是否为同一张图（仅重新压缩/缩放），任一为 None 时为 False"""
+    if a is None or b is None:
+        return False
+    (aspect_a, bits_a), (aspect_b, bits_b) = a, b
+    if abs(aspect_a - aspect_b) > ASPECT_TOLERANCE * max(aspect_a, aspect_b):
+        return False
+    return bin(bits_a ^ bits_b).count("1") <= DETAIL_RADIUS
+
+
+def dhash_files(paths: Iterable[Path], workers: int = 4) -> List[Optional[int]]:
+    """并发计算多张图片的 dHash（按输入顺序返回）"""
+    paths = list(paths)
+    if not PIL_AVAILABLE or not paths:
+        return [None] * len(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(dhash, paths))
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树
+
+    每个节点为 [哈希, 数据, {距离: 子节点}]。查询半径 r 时，
+    只需访问与当前节点距离在 [d-r, d+r] 内的子树。
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, Any]] = ()):
+        self.root = None
+        self.size = 0
+        for value, data in items:
+            self.add(value, data)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, value: int, data: Any):
+        """添加哈希（完全相同的哈希只保留第一个）"""
+        node = [value, data, {}]
+        if self.root is None:
+            self.root = node
+            self.size = 1
+            return
+
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                self.size += 1
+                return
+            current = child
+
+    def search(self, value: int, radius: int = NEAR_DUP_RADIUS) -> List[Tuple[int, Any]]:
+        """查找距离不超过 radius 的所有哈希
+
+        Returns:
+            [(距离, 数据), ...]，按距离升序
+        """
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, value: int, radius: int = NEAR_DUP_RADIUS) -> Optional[Any]:
+        """返回距离不超过 radius 的最近一个哈希的数据，没有则返回 None"""
+        results = self.search(value, radius)
+        return results[0][1] if results else None
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流水线模块 - 用有界队列连接的多阶段生产者/消费者流水线
+- 每个阶段由若干线程组成，按批从输入队列取出数据，处理后逐项放入下一阶段的队列
+- 队列有容量上限：下游处理不过来时上游阻塞等待（背压），在途数据量和内存占用有上限
+- 阶段之间没有屏障：前面的图片还在识别时，后面的图片已在解码、前面的结果已在写入
+"""
+
+import sys
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Union
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# 数据结束标记（每个工作线程收到一个后退出）
+_END = object()
+
+# 队列阻塞操作的轮询间隔（秒），用于及时响应取消
+_POLL_INTERVAL = 0.1
+
+
+class Stage:
+    """流水线中的一个阶段"""
+
+    def __init__(self, name: str, func: Callable[[List[Any]], Iterable[Any]], workers: int = 1,
+                 batch_size: Union[int, Callable[[], int]] = 1, queue_size: int = 16):
+        """
+        Args:
+            name: 阶段名称（用于线程名和统计日志）
+            func: 处理函数 func(一批数据) -> 输出数据，输出逐项放入下一阶段（最后一个阶段的输出被丢弃）
+            workers: 工作线程数
+            batch_size: 每次最多取出的数据项数，也可以是返回当前上限的函数（如随内存调整的批大小）
+            queue_size: 输入队列容量（数据项数）
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.queue_size = max(1, queue_size)
+
+        # 统计：处理的数据项数、处理函数累计耗时
+        self.processed = 0
+        self.busy_seconds = 0.0
+
+    def current_batch_size(self) -> int:
+        size = self.batch_size() if callable(self.batch_size) else self.batch_size
+        return max(1, size)
+
+
+class Pipeline:
+    """多阶段流水线
+
+    run() 在调用线程中逐项读取数据源并送入第一个阶段，全部数据流经所有阶段后返回。
+    任一阶段的处理函数抛出异常时取消整个流水线，run() 重新抛出该异常
+    （处理函数应自行处理单个数据项的失败，只让无法继续的错误抛出）。
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self._queues = []
+        self._remaining = []
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._error = None
+
+    def cancel(self):
+        """取消流水线：各阶段停止取数据，队列中剩余的数据被丢弃"""
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def run(self, source: Iterable[Any]):
+        """运行流水线直到数据源耗尽且所有数据处理完毕（或被取消）"""
+        self._cancel.clear()
+        self._error = None
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        self._remaining = [stage.workers for stage in self.stages]
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage.processed = 0
+            stage.busy_seconds = 0.0
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,),
+                                          name=f"pipeline-{stage.name}-{n}")
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+        started = time.monotonic()
+        try:
+            for item in source:
+                if not self._put(0, item):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._put(0, _END)
+            for thread in threads:
+                thread.join()
+
+        self._log_stats(time.monotonic() - started)
+        if self._error is not None:
+            raise self._error
+
+    # ==================== 内部实现 ====================
+
+    def _put(self, index: int, item) -> bool:
+        """放入第 index 个阶段的队列（队列满时等待），已取消时返回 False"""
+        target = self._queues[index]
+        while not self._cancel.is_set():
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, index: int):
+        """从第 index 个阶段的队列取出一项，已取消时返回 _END"""
+        source = self._queues[index]
+        while not self._cancel.is_set():
+            try:
+                return source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._cancel.set()
+
+    def _worker(self, index: int):
+        """阶段工作线程：按批取数据、处理、把输出放入下一阶段"""
+        stage = self.stages[index]
+        last = index == len(self.stages) - 1
+        finished = False
+        try:
+            while not finished and not self._cancel.is_set():
+                item = self._get(index)
+                if item is _END:
+                    break
+
+                # 尽量凑满一批，但不等待：上游来不及时以较小的批继续处理
+                batch = [item]
+                limit = stage.current_batch_size()
+                while len(batch) < limit:
+                    try:
+                        item = self._queues[index].get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+
+                begin = time.monotonic()
+                outputs = stage.func(batch)
+                with self._lock:
+                    stage.busy_seconds += time.monotonic() - begin
+                    stage.processed += len(batch)
+
+                if not last and outputs:
+                    for output in outputs:
+                        if not self._put(index + 1, output):
+                            return
+        except BaseException as e:
+            logger.error(f"流水线阶段 {stage.name} 出错: {e}")
+            self._fail(e)
+        finally:
+            # 本阶段最后一个退出的线程通知下一阶段结束
+            with self._lock:
+                self._remaining[index] -= 1
+                done = self._remaining[index] == 0
+            if done and not last:
+                for _ in range(self.stages[index + 1].workers):
+                    self._put(index + 1, _END)
+
+    def _log_stats(self, elapsed: float):
+        """记录各阶段的处理量和忙碌程度，便于调整各阶段并发数"""
+        if not elapsed or not any(stage.processed for stage in self.stages):
+            return
+        parts = []
+        for stage in self.stages:
+            busy = stage.busy_seconds / (elapsed * stage.workers) * 100
+            parts.append(f"{stage.name}×{stage.workers}: {stage.processed} 项, 忙碌 {busy:.0f}%")
+        logger.info(f"流水线完成 ({elapsed:.1f}s) - " + "; ".join(parts))
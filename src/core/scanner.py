@@ -5,9 +5,245 @@
 """
 
 import os
+import sys
+import time
+import threading
 import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from typing import List, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+
+logger = get_logger()
+
+
+class FileManifest:
+    """文件状态清单 - 记录每个文件的 (大小, mtime_ns, inode, 哈希)
+    
+    重新扫描时，stat 信息未变化的文件直接复用清单中的哈希值，
+    只有新文件或 stat 信息变化的文件才需要重新计算哈希。
+    同时记录每个目录的 mtime：目录中增删文件会改变其 mtime，
+    mtime 未变化的目录无需重新列出。
+    
+    目录记录只在其下文件全部处理完之后才生效（见 release_dirs），
+    因此扫描中途分批保存的清单可以作为断点：中断后重新扫描会跳过已完成的目录。
+    """
+    
+    # 目录需要重新列出时记录的 mtime（已知目录，但内容未确认）
+    DIR_UNVERIFIED = -1
+    
+    def __init__(self, entries: Dict[str, Tuple[int, int, int, str]] = None,
+                 dir_mtimes: Dict[str, int] = None):
+        self.entries = dict(entries) if entries else {}
+        self.dir_mtimes = dict(dir_mtimes) if dir_mtimes else {}
+        # 本次扫描中产生的变更（用于增量写回数据库）
+        self.updated: Dict[str, Tuple[int, int, int, str]] = {}
+        self.removed: Set[str] = set()
+        self.dirs_updated: Dict[str, int] = {}
+        self.dirs_removed: Set[str] = set()
+        # 本次扫描中有文件处理失败的目录（不记录 mtime，下次重新列出）
+        self.failed_dirs: Set[str] = set()
+        # 已遍历但文件尚未全部处理完的目录 [(提交序号, 目录, mtime), ...]
+        self.submitted = 0
+        self.staging = False
+        self._staged_dirs: List[Tuple[int, str, int]] = []
+        # (大小, mtime_ns, inode) -> (路径, 哈希)，用于识别重命名/移动的文件
+        self._by_stat: Optional[Dict[Tuple[int, int, int], Tuple[str, str]]] = None
+        self._removed_entries: Dict[str, Tuple[int, int, int, str]] = {}
+    
+    @staticmethod
+    def stat_key(st: os.stat_result) -> Tuple[int, int, int]:
+        """从 stat 结果中提取 (大小, mtime_ns, inode)"""
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+    
+    def lookup(self, file_path: str, st: os.stat_result) -> Optional[str]:
+        """stat 信息未变化时返回已记录的哈希值，否则返回 None"""
+        entry = self.entries.get(file_path)
+        if entry is not None and entry[:3] == self.stat_key(st):
+            return entry[3]
+        return None
+    
+    def lookup_moved(self, file_path: str, st: os.stat_result) -> Optional[str]:
+        """新路径与某个已不存在的旧路径 (大小, mtime_ns, inode) 相同时（重命名/移动），
+        返回旧路径记录的哈希值，否则返回 None"""
+        if not st.st_ino:
+            # 文件系统不提供 inode 时无法判断
+            return None
+        if self._by_stat is None:
+            self._by_stat = {}
+            for entries in (self.entries, self._removed_entries):
+                for fp, entry in entries.items():
+                    self._by_stat[entry[:3]] = (fp, entry[3])
+        
+        found = self._by_stat.get(self.stat_key(st))
+        if found is None:
+            return None
+        old_path, file_hash = found
+        if old_path == file_path or os.path.exists(old_path):
+            return None
+        return file_hash
+    
+    def update(self, file_path: str, st: os.stat_result, file_hash: str):
+        """记录文件的最新 stat 信息和哈希值"""
+        entry = self.stat_key(st) + (file_hash,)
+        self.entries[file_path] = entry
+        self.updated[file_path] = entry
+        self.removed.discard(file_path)
+    
+    def remove(self, file_path: str):
+        """移除已不存在的文件"""
+        entry = self.entries.pop(file_path, None)
+        if entry is not None:
+            self._removed_entries[file_path] = entry
+        self.updated.pop(file_path, None)
+        self.removed.add(file_path)
+    
+    def rehash(self, file_path: str, file_hash: str):
+        """文件内容未变，仅更新其哈希值（快速指纹升级为完整哈希时使用）"""
+        entry = self.entries.get(file_path)
+        if entry is not None:
+            entry = entry[:3] + (file_hash,)
+            self.entries[file_path] = entry
+            self.updated[file_path] = entry
+    
+    def mark_failed(self, file_path: str):
+        """标记文件处理失败，其所在目录下次扫描时需要重新列出"""
+        dir_path = os.path.dirname(file_path)
+        self.failed_dirs.add(dir_path)
+        self.invalidate_dir(dir_path)
+    
+    def _set_dir(self, dir_path: str, mtime_ns: int):
+        self.dir_mtimes[dir_path] = mtime_ns
+        self.dirs_updated[dir_path] = mtime_ns
+        self.dirs_removed.discard(dir_path)
+    
+    def update_dir(self, dir_path: str, mtime_ns: int):
+        """记录目录的 mtime（staging 时暂存，待其文件处理完后由 release_dirs 生效）"""
+        if self.staging:
+            self._staged_dirs.append((self.submitted, dir_path, mtime_ns))
+        else:
+            self._set_dir(dir_path, mtime_ns)
+    
+    def invalidate_dir(self, dir_path: str):
+        """保留目录记录但要求下次扫描重新列出"""
+        self._set_dir(dir_path, self.DIR_UNVERIFIED)
+    
+    def release_dirs(self, outstanding: int = None):
+        """使暂存的目录记录生效
+        
+        Args:
+            outstanding: 仍在处理中的最小文件提交序号，None 表示全部已处理完
+        """
+        remaining = []
+        for staged in self._staged_dirs:
+            seq, dir_path, mtime_ns = staged
+            if outstanding is not None and seq > outstanding:
+                remaining.append(staged)
+            elif dir_path not in self.failed_dirs:
+                self._set_dir(dir_path, mtime_ns)
+        self._staged_dirs = remaining
+    
+    def remove_dir(self, dir_path: str):
+        """移除目录记录（目录已不存在或需要重新列出）"""
+        if self.dir_mtimes.pop(dir_path, None) is not None:
+            self.dirs_removed.add(dir_path)
+        self.dirs_updated.pop(dir_path, None)
+    
+    def pending(self) -> Tuple[List[Tuple[str, int, int, int, str]], List[str]]:
+        """获取待保存的变更
+        
+        Returns:
+            ([(file_path, file_size, mtime_ns, inode, file_hash), ...], [removed_path, ...])
+        """
+        entries = [(fp,) + entry for fp, entry in self.updated.items()]
+        return entries, sorted(self.removed)
+    
+    def pending_dirs(self) -> Tuple[List[Tuple[str, int]], List[str]]:
+        """获取待保存的目录变更
+        
+        Returns:
+            ([(dir_path, mtime_ns), ...], [removed_dir, ...])
+        """
+        return list(self.dirs_updated.items()), sorted(self.dirs_removed)
+    
+    def clear_pending(self):
+        """变更已保存后清空"""
+        self.updated.clear()
+        self.removed.clear()
+        self.dirs_updated.clear()
+        self.dirs_removed.clear()
+
+
+class FingerprintIndex:
+    """快速指纹索引（quick_hash -> (文件路径, file_hash)）
+    
+    大文件先只计算快速指纹（大小 + 首尾各 64 KB 的哈希），此时 file_hash 记为
+    "q:<quick_hash>"；只有快速指纹与已知图片冲突时才计算双方的完整哈希，
+    被升级的已有图片记录在 upgrades 中，用于写回数据库。
+    """
+    
+    def __init__(self, entries: Dict[str, Tuple[str, str]] = None):
+        self.entries = dict(entries) if entries else {}
+        # file_path -> (旧 file_hash, 完整哈希)
+        self.upgrades: Dict[str, Tuple[str, str]] = {}
+    
+    def get(self, quick_hash: str) -> Optional[Tuple[str, str]]:
+        return self.entries.get(quick_hash)
+    
+    def add(self, quick_hash: str, file_path: str, file_hash: str):
+        """登记指纹（已有登记时保留原有记录）"""
+        self.entries.setdefault(quick_hash, (file_path, file_hash))
+    
+    def upgrade(self, quick_hash: str, file_path: str, old_hash: str, full_hash: str):
+        """已有图片的快速指纹升级为完整哈希"""
+        self.entries[quick_hash] = (file_path, full_hash)
+        self.upgrades[file_path] = (old_hash, full_hash)
+    
+    def pending(self) -> List[Tuple[str, str, str]]:
+        """获取待保存的哈希升级 [(file_path, 旧 file_hash, 完整哈希), ...]"""
+        return [(fp, old, new) for fp, (old, new) in self.upgrades.items()]
+    
+    def clear_pending(self):
+        self.upgrades.clear()
+
+
+class HashStats:
+    """扫描与哈希计算统计（目录数、文件数、字节数、耗时）
+    
+    扫描线程写入、界面线程读取，各字段均为简单计数，读取时无需加锁。
+    """
+    
+    def __init__(self):
+        self.dirs = 0
+        self.seen_files = 0
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+    
+    def add(self, nbytes: int):
+        self.files += 1
+        self.bytes += nbytes
+    
+    @property
+    def elapsed(self) -> float:
+        return max(time.perf_counter() - self.started, 1e-9)
+    
+    @property
+    def files_per_sec(self) -> float:
+        return self.files / self.elapsed
+    
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / 1024 / 1024 / self.elapsed
+    
+    def summary(self) -> str:
+        return (f"{self.files} 个文件, {self.bytes / 1024 / 1024:.1f} MB, "
+                f"{self.files_per_sec:.1f} 文件/秒, {self.mb_per_sec:.1f} MB/秒")
 
 
 class ImageScanner:
@@ -16,6 +252,16 @@ class ImageScanner:
     # 支持的图片扩展名
     IMG_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tiff'}
     
+    # 目录 mtime 距扫描开始不足该时长时不记录（避免同一时间粒度内的修改被漏掉）
+    DIR_MTIME_GRACE_NS = 2 * 10**9
+    
+    # 哈希计算读缓冲区大小
+    HASH_BUFFER_SIZE = 1024 * 1024
+    
+    # 快速指纹：首尾各取样 64 KB；不超过两倍取样大小的文件直接计算完整哈希
+    QUICK_SAMPLE_SIZE = 64 * 1024
+    QUICK_HASH_PREFIX = "q:"
+    
     def __init__(self):
         pass
     
@@ -25,43 +271,300 @@ class ImageScanner:
         return file_path.is_file() and file_path.suffix.lower() in ImageScanner.IMG_EXTENSIONS
     
     @staticmethod
-    def scan_folder(folder_path: str) -> List[Path]:
-        """扫描文件夹中的所有图片"""
-        folder = Path(folder_path)
-        if not folder.exists():
-            return []
+    def iter_image_files(folder_path: str, manifest: FileManifest = None,
+                         stats: HashStats = None) -> Iterator[Tuple[Path, os.stat_result]]:
+        """遍历文件夹中的图片，逐个返回 (路径, stat 结果)
+        
+        提供 manifest 时，mtime 与上次记录一致的目录不再列出（其文件直接沿用清单），
+        只继续检查其已知的子目录；被删除的文件和目录会从清单中移除。
+        注意：原地修改文件内容不会改变目录 mtime，这类变化只有在目录本身变化时才会被发现。
+        """
+        root = str(Path(folder_path))
+        scan_started_ns = time.time_ns()
+        
+        files_by_dir: Dict[str, Set[str]] = defaultdict(set)
+        dirs_by_parent: Dict[str, Set[str]] = defaultdict(set)
+        if manifest is not None:
+            for file_path in manifest.entries:
+                files_by_dir[os.path.dirname(file_path)].add(file_path)
+            for dir_path in manifest.dir_mtimes:
+                dirs_by_parent[os.path.dirname(dir_path)].add(dir_path)
         
-        images = []
-        for root, dirs, files in os.walk(folder):
-            for file in files:
-                file_path = Path(root) / file
-                if ImageScanner.is_image_file(file_path):
-                    images.append(file_path)
+        def _remove_tree(dir_path: str):
+            # 目录已不存在：移除其下所有文件和子目录的记录
+            pending = [dir_path]
+            while pending:
+                d = pending.pop()
+                for file_path in files_by_dir.pop(d, ()):
+                    manifest.remove(file_path)
+                pending.extend(dirs_by_parent.pop(d, ()))
+                manifest.remove_dir(d)
         
-        return sorted(images)
+        stack = [root]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                if manifest is not None:
+                    _remove_tree(dir_path)
+                continue
+            if stats is not None:
+                stats.dirs += 1
+            
+            if manifest is not None and manifest.dir_mtimes.get(dir_path) == dir_mtime:
+                # 目录项未变化，跳过列目录
+                stack.extend(sorted(dirs_by_parent.get(dir_path, ()), reverse=True))
+                continue
+            
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            
+            subdirs = []
+            seen_files = set()
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif (os.path.splitext(entry.name)[1].lower() in ImageScanner.IMG_EXTENSIONS
+                          and entry.is_file()):
+                        st = entry.stat()
+                        seen_files.add(entry.path)
+                        if stats is not None:
+                            stats.seen_files += 1
+                        yield Path(entry.path), st
+                except OSError:
+                    continue
+            
+            if manifest is not None:
+                for file_path in files_by_dir.get(dir_path, set()) - seen_files:
+                    manifest.remove(file_path)
+                for sub_dir in dirs_by_parent.get(dir_path, set()) - set(subdirs):
+                    _remove_tree(sub_dir)
+                # 先登记新出现的子目录，保证父目录记录生效后子目录仍会被扫描
+                for sub_dir in subdirs:
+                    if sub_dir not in manifest.dir_mtimes:
+                        manifest.invalidate_dir(sub_dir)
+                if (dir_path not in manifest.failed_dirs
+                        and dir_mtime < scan_started_ns - ImageScanner.DIR_MTIME_GRACE_NS):
+                    manifest.update_dir(dir_path, dir_mtime)
+                else:
+                    manifest.invalidate_dir(dir_path)
+            
+            stack.extend(reversed(subdirs))
     
     @staticmethod
-    def calculate_file_hash(file_path: Path) -> str:
-        """计算文件MD5哈希值"""
+    def default_hash_workers() -> int:
+        """默认哈希线程数（hashlib 计算大块数据时会释放 GIL）"""
+        return min(32, (os.cpu_count() or 1) + 4)
+    
+    @staticmethod
+    def _md5_file(file_path: Path, buffer_size: int) -> Tuple[str, int]:
+        """计算文件MD5哈希值，返回 (哈希值, 读取字节数)"""
         hash_md5 = hashlib.md5()
+        nbytes = 0
         try:
             with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
+                for chunk in iter(lambda: f.read(buffer_size), b""):
                     hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+                    nbytes += len(chunk)
+            return hash_md5.hexdigest(), nbytes
         except Exception as e:
-            return f"error_{file_path.name}"
+            return f"error_{file_path.name}", nbytes
     
     @staticmethod
-    def find_new_images(folder_path: str, existing_hashes: Set[str]) -> List[Tuple[Path, str]]:
-        """查找新图片（返回图片路径和哈希值的列表）"""
-        all_images = ImageScanner.scan_folder(folder_path)
-        new_images = []
-        
-        for img_path in all_images:
-            img_hash = ImageScanner.calculate_file_hash(img_path)
-            if img_hash not in existing_hashes:
-                new_images.append((img_path, img_hash))
-                existing_hashes.add(img_hash)
-        
-        return new_images
+    def calculate_file_hash(file_path: Path, buffer_size: int = None) -> str:
+        """计算文件MD5哈希值"""
+        return ImageScanner._md5_file(file_path, buffer_size or ImageScanner.HASH_BUFFER_SIZE)[0]
+    
+    @staticmethod
+    def _quick_hash_file(file_path: Path, buffer_size: int) -> Tuple[str, int]:
+        """计算快速指纹，返回 ("q:<quick_hash>" 或小文件的完整哈希, 读取字节数)"""
+        sample = ImageScanner.QUICK_SAMPLE_SIZE
+        try:
+            with open(file_path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size <= 2 * sample:
+                    data = f.read()
+                    return hashlib.md5(data).hexdigest(), len(data)
+                hash_md5 = hashlib.md5(str(size).encode())
+                head = f.read(sample)
+                f.seek(-sample, os.SEEK_END)
+                tail = f.read(sample)
+                hash_md5.update(head)
+                hash_md5.update(tail)
+            return ImageScanner.QUICK_HASH_PREFIX + hash_md5.hexdigest(), len(head) + len(tail)
+        except Exception:
+            return f"error_{file_path.name}", 0
+    
+    @staticmethod
+    def quick_part(file_hash: str) -> str:
+        """从 file_hash 中取出快速指纹部分（完整哈希原样返回）"""
+        if file_hash.startswith(ImageScanner.QUICK_HASH_PREFIX):
+            return file_hash[len(ImageScanner.QUICK_HASH_PREFIX):]
+        return file_hash
+    
+    @staticmethod
+    def hash_files(paths: Iterable[Path], workers: int = None, buffer_size: int = None,
+                   stats: HashStats = None, quick: bool = False) -> Iterator[Tuple[Path, str]]:
+        """多线程计算文件哈希，按完成顺序逐个返回 (路径, 哈希值)
+        
+        Args:
+            paths: 待计算的文件路径（可以是生成器，按需拉取）
+            workers: 线程数，默认 default_hash_workers()
+            buffer_size: 读缓冲区大小，默认 HASH_BUFFER_SIZE
+            stats: 统计对象，提供时累计文件数和字节数
+            quick: 为 True 时只计算快速指纹（见 FingerprintIndex）
+        """
+        hash_func = ImageScanner._quick_hash_file if quick else ImageScanner._md5_file
+        workers = max(1, workers or ImageScanner.default_hash_workers())
+        buffer_size = buffer_size or ImageScanner.HASH_BUFFER_SIZE
+        # 限制同时在途的任务数，避免生成器被一次性读完
+        max_pending = workers * 4
+        
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        pending = {}
+        try:
+            path_iter = iter(paths)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        path = next(path_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(hash_func, path, buffer_size)] = path
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    file_hash, nbytes = future.result()
+                    if stats is not None:
+                        if file_hash.startswith("error_"):
+                            stats.errors += 1
+                        else:
+                            stats.add(nbytes)
+                    yield path, file_hash
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    @staticmethod
+    def iter_new_images(folder_path: str, existing_hashes: Set[str],
+                        manifest: FileManifest = None, workers: int = None,
+                        stats: HashStats = None,
+                        fingerprints: FingerprintIndex = None,
+                        cancel: threading.Event = None) -> Iterator[Tuple[Path, str, int, str]]:
+        """查找新图片，边扫描边逐个返回（内存占用与图源大小无关）
+        
+        注意：开启快速指纹时，已返回图片的 file_hash 可能在后续冲突时被升级，
+        升级记录在 fingerprints.upgrades 中，应在对应图片写入数据库之后再应用。
+        
+        Args:
+            folder_path: 图源文件夹
+            existing_hashes: 已存在的哈希集合（会被原地更新）
+            manifest: 文件状态清单，提供时跳过未变化的目录，只对新文件或 stat 变化的文件
+                      计算哈希，并原地记录本次扫描的变更
+            workers: 哈希计算线程数，默认 default_hash_workers()
+            stats: 哈希计算统计对象
+            fingerprints: 快速指纹索引，提供时大文件先只计算快速指纹，
+                          冲突时才计算完整哈希
+            cancel: 取消事件，设置后停止遍历，已提交的文件处理完后正常结束
+        
+        Yields:
+            (图片路径, file_hash, 文件大小, quick_hash)，未使用快速指纹时 quick_hash 为 None
+        """
+        # key -> (提交序号, stat 结果)，按提交顺序排列
+        pending_stats: Dict[str, Tuple[int, os.stat_result]] = {}
+        stats = stats if stats is not None else HashStats()
+        quick = fingerprints is not None
+        prefix = ImageScanner.QUICK_HASH_PREFIX
+        
+        def _resolve(img_path: Path, value: str) -> str:
+            # 快速指纹未冲突时直接使用；冲突时计算双方完整哈希
+            quick_hash = ImageScanner.quick_part(value)
+            known = fingerprints.get(quick_hash)
+            if known is None or not value.startswith(prefix):
+                fingerprints.add(quick_hash, str(img_path), value)
+                return value
+            
+            known_path, known_hash = known
+            if known_path == str(img_path):
+                # 同一文件重新扫描（如仅 mtime 变化）
+                if known_hash.startswith(prefix):
+                    return value
+                return ImageScanner.calculate_file_hash(img_path)
+            
+            if known_hash.startswith(prefix):
+                known_full = ImageScanner.calculate_file_hash(Path(known_path))
+                if known_full.startswith("error_"):
+                    # 原图片已不存在（多为移动/重命名），由当前文件接替该指纹，
+                    # 沿用快速指纹作为哈希以便与原记录对应
+                    fingerprints.entries[quick_hash] = (str(img_path), value)
+                    return value
+                fingerprints.upgrade(quick_hash, known_path, known_hash, known_full)
+                if manifest is not None:
+                    manifest.rehash(known_path, known_full)
+                if known_hash in existing_hashes:
+                    existing_hashes.discard(known_hash)
+                    existing_hashes.add(known_full)
+            return ImageScanner.calculate_file_hash(img_path)
+        
+        def _to_hash() -> Iterator[Path]:
+            # 清单中未变化且已入库的文件直接跳过，其余交给哈希线程池
+            for img_path, st in ImageScanner.iter_image_files(folder_path, manifest, stats):
+                if cancel is not None and cancel.is_set():
+                    logger.info(f"扫描已取消: {folder_path}")
+                    return
+                key = str(img_path)
+                seq = 0
+                if manifest is not None:
+                    img_hash = manifest.lookup(key, st)
+                    if img_hash is None:
+                        # 重命名/移动的文件沿用原哈希，无需重新计算
+                        img_hash = manifest.lookup_moved(key, st)
+                        if img_hash is not None:
+                            manifest.update(key, st, img_hash)
+                    if img_hash is not None and img_hash in existing_hashes:
+                        continue
+                    seq = manifest.submitted
+                    manifest.submitted += 1
+                pending_stats[key] = (seq, st)
+                yield img_path
+        
+        if manifest is not None:
+            manifest.staging = True
+        
+        for img_path, img_hash in ImageScanner.hash_files(_to_hash(), workers=workers,
+                                                          stats=stats, quick=quick):
+            key = str(img_path)
+            _, st = pending_stats.pop(key)
+            if manifest is not None and img_hash.startswith("error_"):
+                manifest.mark_failed(key)
+            else:
+                quick_hash = None
+                if quick and not img_hash.startswith("error_"):
+                    quick_hash = ImageScanner.quick_part(img_hash)
+                    img_hash = _resolve(img_path, img_hash)
+                if manifest is not None:
+                    manifest.update(key, st, img_hash)
+                if img_hash not in existing_hashes:
+                    existing_hashes.add(img_hash)
+                    yield img_path, img_hash, st.st_size, quick_hash
+            
+            if manifest is not None:
+                # 之前提交的文件都已处理完的目录，其记录可以生效
+                outstanding = next(iter(pending_stats.values()))[0] if pending_stats else manifest.submitted
+                manifest.release_dirs(outstanding)
+        
+        if manifest is not None:
+            manifest.release_dirs()
+            manifest.staging = False
+        
+        if stats.files:
+            logger.info(f"扫描 {folder_path}: 计算哈希 {stats.summary()}")
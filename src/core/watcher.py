@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+图源监控模块 - 监听图源文件夹变化并实时入库
+- 优先使用 watchdog（Linux 下基于 inotify），只重新列出发生变化的目录
+- 未安装 watchdog 时回退为定时增量扫描（依赖目录 mtime 跳过未变化的目录）；
+  原地修改文件不会改变目录 mtime，因此每次轮询还会轮流 stat 清单中的一段已知文件，
+  找出被修改的文件（开销固定，不随图库大小增长；修改的文件在几轮之内被发现）
+- 短时间内的大量事件（如批量复制）会被合并为一次分批入库
+"""
+
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Set, Tuple
+
+from .scanner import ImageScanner, FileManifest, FingerprintIndex, HashStats
+from .ingest import ingest_source, scan_generation
+
+# 添加日志支持
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# watchdog 为可选依赖
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+
+class _SourceEventHandler(FileSystemEventHandler):
+    """将文件系统事件转换为"目录已变化"标记"""
+    
+    def __init__(self, watcher: 'SourceWatcher', source_id: int):
+        super().__init__()
+        self.watcher = watcher
+        self.source_id = source_id
+    
+    def on_any_event(self, event):
+        paths = [event.src_path]
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            paths.append(dest_path)
+        
+        for path in paths:
+            path = os.fsdecode(path)
+            if event.is_directory:
+                self.watcher.mark_dirty(self.source_id, path)
+                self.watcher.mark_dirty(self.source_id, os.path.dirname(path))
+            elif os.path.splitext(path)[1].lower() in ImageScanner.IMG_EXTENSIONS:
+                self.watcher.mark_dirty(self.source_id, os.path.dirname(path))
+
+
+class SourceWatcher:
+    """图源监控器
+    
+    监控所有启用的图源，新建/修改/删除的图片在几秒内同步到 images 表
+    （新图片即进入待处理队列）。
+    """
+    
+    def __init__(self, db, debounce: float = 1.0, max_delay: float = 5.0,
+                 poll_interval: float = 30.0, on_change: Callable[[int], None] = None,
+                 use_watchdog: bool = True, stat_files_per_poll: int = 2000):
+        """
+        Args:
+            db: ImageDatabase
+            debounce: 事件静默多少秒后开始入库（合并事件风暴）
+            max_delay: 持续有事件时最长等待秒数
+            poll_interval: 轮询模式下的增量扫描间隔（秒）
+            on_change: 每次入库后回调 on_change(新增或变化的图片数)，在监控线程中调用
+            use_watchdog: 是否使用 watchdog（不可用时自动回退为轮询）
+            stat_files_per_poll: 轮询模式下每次检查是否被原地修改的已知文件数
+                                 （轮流检查，如 10 万个文件约 25 分钟检查一遍）
+        """
+        self.db = db
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.use_watchdog = use_watchdog and WATCHDOG_AVAILABLE
+        self.stat_files_per_poll = stat_files_per_poll
+        # 轮询模式下已检查到的文件状态清单位置（rowid）
+        self._stat_after = 0
+        
+        # source_id -> 已变化的目录集合（空集合表示整个图源需要增量扫描）
+        self._dirty: Dict[int, Set[str]] = {}
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        
+        self._thread = None
+        self._observer = None
+        self._watches = {}
+        self._fingerprints = None
+        self._fingerprints_generation = -1
+    
+    @property
+    def mode(self) -> str:
+        """监控方式：'watchdog' 或 'polling'"""
+        return 'watchdog' if self.use_watchdog else 'polling'
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """启动监控"""
+        if self.running:
+            return
+        
+        self._stop.clear()
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.start()
+            self.refresh_sources()
+        
+        self._thread = threading.Thread(target=self._run, name="source-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"图源监控已启动 (方式: {self.mode})")
+    
+    def stop(self):
+        """停止监控"""
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            except Exception as e:
+                logger.warning(f"停止文件监控失败: {e}")
+            self._observer = None
+            self._watches.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info("图源监控已停止")
+    
+    def refresh_sources(self):
+        """图源列表变化后重新设置监控（轮询模式下无需调用）"""
+        if self._observer is None:
+            return
+        
+        enabled = {s['id']: s['folder_path'] for s in self.db.get_sources()
+                   if s['enabled'] and os.path.isdir(s['folder_path'])}
+        
+        for source_id in list(self._watches):
+            if source_id not in enabled:
+                self._observer.unschedule(self._watches.pop(source_id))
+        
+        for source_id, folder_path in enabled.items():
+            if source_id in self._watches:
+                continue
+            try:
+                handler = _SourceEventHandler(self, source_id)
+                self._watches[source_id] = self._observer.schedule(handler, folder_path, recursive=True)
+                # 启动监控前可能已有变化，先做一次增量扫描
+                self.mark_dirty(source_id)
+            except Exception as e:
+                logger.warning(f"监控图源失败 {folder_path}: {e}")
+    
+    def mark_dirty(self, source_id: int, dir_path: str = None):
+        """标记图源（或其中某个目录）发生了变化"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty:
+                self._first_event = now
+            self._last_event = now
+            dirs = self._dirty.setdefault(source_id, set())
+            if dir_path:
+                dirs.add(dir_path)
+        self._wake.set()
+    
+    def _run(self):
+        """监控线程：等待事件，合并后分批入库"""
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            if self.use_watchdog:
+                self._wake.wait()
+            else:
+                self._wake.wait(max(0.0, next_poll - time.monotonic()))
+                if time.monotonic() >= next_poll:
+                    enabled = {source['id'] for source in self.db.get_sources() if source['enabled']}
+                    for source_id in enabled:
+                        self.mark_dirty(source_id)
+                    for source_id, dir_path in self._modified_dirs():
+                        if source_id in enabled:
+                            self.mark_dirty(source_id, dir_path)
+                    next_poll = time.monotonic() + self.poll_interval
+            if self._stop.is_set():
+                break
+            
+            # 合并事件风暴：等待事件静默 debounce 秒，最长等待 max_delay 秒
+            while not self._stop.is_set():
+                now = time.monotonic()
+                with self._lock:
+                    quiet = now - self._last_event
+                    waited = now - self._first_event
+                if quiet >= self.debounce or waited >= self.max_delay:
+                    break
+                self._stop.wait(min(self.debounce - quiet, self.max_delay - waited))
+            if self._stop.is_set():
+                break
+            
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._wake.clear()
+            if dirty:
+                self._ingest(dirty)
+    
+    def _modified_dirs(self) -> Set[Tuple[int, str]]:
+        """轮询模式：stat 文件状态清单中的下一段已知文件，返回有文件被原地修改的 (图源ID, 目录)
+        
+        修改文件内容不会改变所在目录的 mtime，只靠目录 mtime 的增量扫描发现不了。
+        每次只检查 stat_files_per_poll 个文件，到清单末尾后从头开始。
+        已删除的文件会改变目录 mtime，由增量扫描处理。
+        """
+        modified = set()
+        try:
+            rows = self.db.get_manifest_slice(self._stat_after, self.stat_files_per_poll)
+        except Exception as e:
+            logger.warning(f"读取文件状态清单失败: {e}")
+            return modified
+        self._stat_after = rows[-1][0] if len(rows) >= self.stat_files_per_poll else 0
+        
+        for _, file_path, source_id, file_size, mtime_ns, inode in rows:
+            if self._stop.is_set():
+                break
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if (file_size, mtime_ns, inode) != FileManifest.stat_key(st):
+                modified.add((source_id, os.path.dirname(file_path)))
+        return modified
+    
+    def _ingest(self, dirty: Dict[int, Set[str]]):
+        """将变化同步到数据库"""
+        try:
+            sources = {s['id']: s for s in self.db.get_sources()}
+            
+            # 其他入库流程（如手动扫描）完成后重新加载指纹索引
+            if self._fingerprints is None or self._fingerprints_generation != scan_generation():
+                self._fingerprints = FingerprintIndex(self.db.get_quick_fingerprints())
+            
+            total = 0
+            for source_id, dirs in dirty.items():
+                source = sources.get(source_id)
+                if not source or not source['enabled'] or not os.path.isdir(source['folder_path']):
+                    continue
+                stats = HashStats()
+                total += ingest_source(self.db, source_id, source['folder_path'], self._fingerprints,
+                                       stats=stats, cancel=self._stop, dirty_dirs=dirs)
+            self._fingerprints_generation = scan_generation()
+            
+            if total:
+                logger.info(f"图源监控: 同步了 {total} 张新增或变化的图片")
+            if self.on_change:
+                self.on_change(total)
+        except Exception as e:
+            logger.error(f"图源监控同步失败: {e}")
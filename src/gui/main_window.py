@@ -27,10 +27,19 @@ class MemeFinderGUI:
         # 创建界面
         self.create_widgets()
         
+        # 关闭窗口时先停止后台任务，再提交剩余的写操作并关闭数据库
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # 初始化各标签页
         self.source_tab.refresh_sources()
         self.source_tab.update_statistics()
         
+        # 启动时检查是否有未完成的扫描，需要用户确认是否继续
+        try:
+            self.check_scan_resume()
+        except Exception:
+            pass
+        
         # 启动时检查是否有未完成的处理，需要用户确认是否继续
         try:
             self.check_resume()
@@ -57,10 +66,42 @@ class MemeFinderGUI:
         self.status_bar = ttk.Label(self.root, text="就绪", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
     
+    def on_close(self):
+        """关闭窗口：停止监控、扫描和处理，停止OCR工作进程，写完排队中的数据库操作后退出"""
+        self.update_status("正在退出，等待后台任务结束...")
+        self.root.update_idletasks()
+        for tab in (self.source_tab, self.process_tab):
+            try:
+                tab.shutdown()
+            except Exception:
+                pass
+        try:
+            self.db.close()
+        finally:
+            self.root.destroy()
+    
     def update_status(self, message: str):
         """更新状态栏"""
         self.status_bar.config(text=message)
     
+    def check_scan_resume(self):
+        """检查上次扫描是否被中断并询问用户是否继续"""
+        if self.db.get_app_state('scan_state') != 'running':
+            return
+        
+        msg = "检测到上次扫描图源时被中断。是否继续扫描？\n（已扫描的部分会被跳过）"
+        if messagebox.askyesno("恢复扫描", msg):
+            try:
+                self.notebook.select(self.source_tab.frame)
+            except Exception:
+                pass
+            self.source_tab.scan_sources()
+        else:
+            try:
+                self.db.set_app_state('scan_state', 'idle')
+            except Exception:
+                pass
+    
     def check_resume(self):
         """检查上次的处理状态并询问用户是否继续"""
         state = self.db.get_app_state('processing_state')
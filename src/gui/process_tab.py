@@ -9,30 +9,73 @@ from tkinter import ttk, scrolledtext, messagebox
 from datetime import datetime
 from pathlib import Path
 import threading
+import queue
 import os
 
 from ..core.database import ImageDatabase
 from ..core.ocr_processor import OCRProcessor
+from ..core.ocr_pool import OCRWorkerPool
+from ..core.phash import BKTree, dhash, detail_hash, same_image
+from ..core.pipeline import Pipeline, Stage
 
 
 class ProcessTab:
     """图片处理标签页"""
     
+    # 每次领取的图片数（领取后其他处理者/进程不会重复处理）
+    CLAIM_BATCH = 16
+    
+    # 流水线各阶段的默认线程数和队列容量（可用环境变量调整，见 docs/GPU_ACCELERATION.md）
+    DECODE_THREADS = 2
+    TEXT_THREADS = 1
+    PIPELINE_QUEUE = 2   # 各阶段队列可容纳的批数
+    WRITE_BATCH = 64
+    
+    # 复用相似图片结果时，最多对几个候选图片做二次校验
+    SIMILAR_CANDIDATES = 3
+    
+    # 界面线程执行后台更新的间隔（毫秒）和每次最多执行的更新数
+    UI_POLL_MS = 100
+    UI_POLL_LIMIT = 500
+    
+    # 关闭程序时等待处理线程写完在途结果的最长时间（秒）
+    SHUTDOWN_TIMEOUT = 15
+    
     def __init__(self, parent, db: ImageDatabase):
         self.parent = parent
         self.db = db
         
         # 检查是否启用GPU（通过环境变量或配置）
         use_gpu = self._should_use_gpu()
-        self.ocr_processor = OCRProcessor(use_gpu=use_gpu)
+        batch_size = self._ocr_batch_size()
+        profile = self._ocr_profile()
+        # 工作进程数未指定时由工作池按启动方式自动确定（forkserver 方式下模型只占一份内存）
+        pool = OCRWorkerPool(profile, workers=self._ocr_workers(), batch_size=batch_size, use_gpu=use_gpu,
+                             start_method=self._ocr_start_method())
+        workers = pool.workers
+        if workers > 1:
+            # 多进程识别：模型在工作进程（或 fork 服务进程）中加载，本进程只负责调度和写回结果
+            self.ocr_processor = pool
+        else:
+            self.ocr_processor = OCRProcessor(use_gpu=use_gpu, batch_size=batch_size, profile=profile)
+        # 识别档位随结果写入数据库
+        self.ocr_profile = self.ocr_processor.profile
+        # 是否复用相似图片（重新压缩/缩放的副本）的识别结果
+        self.reuse_similar = self._similar_reuse_enabled()
+        # 每次领取足够所有工作进程各识别两批的图片
+        self.claim_batch = max(self.CLAIM_BATCH, workers * batch_size * 2)
         
         # 处理状态
         self.processing = False
         self.processing_thread = None
         
+        # 后台线程（处理流水线、重置图片）提交的界面更新，由界面线程通过 after() 轮询执行
+        self._ui_queue = queue.Queue()
+        
         # 创建主框架
         self.frame = ttk.Frame(parent)
         self.create_widgets()
+        self.frame.after(self.UI_POLL_MS, self._poll_ui)
     
     def _should_use_gpu(self) -> bool:
         """
@@ -55,6 +98,45 @@ class ProcessTab:
         # 默认使用CPU
         return False
     
+    @staticmethod
+    def _similar_reuse_enabled() -> bool:
+        """是否复用相似图片的识别结果（环境变量 MEMEFINDER_SIMILAR_REUSE，0/false/no/off 关闭，默认开启）"""
+        value = os.environ.get('MEMEFINDER_SIMILAR_REUSE', '').lower()
+        return value not in ('0', 'false', 'no', 'off')
+    
+    @staticmethod
+    def _ocr_workers() -> int:
+        """OCR工作进程数（环境变量 MEMEFINDER_OCR_WORKERS），未设置或 auto 时返回 None（见 OCRWorkerPool.default_workers）"""
+        value = os.environ.get('MEMEFINDER_OCR_WORKERS', '').lower()
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+        return None
+    
+    @staticmethod
+    def _ocr_start_method() -> str:
+        """OCR工作进程启动方式（环境变量 MEMEFINDER_OCR_START_METHOD: forkserver/spawn，未设置时自动选择）"""
+        value = os.environ.get('MEMEFINDER_OCR_START_METHOD', '').lower()
+        return value if value in ('forkserver', 'spawn') else None
+    
+    @staticmethod
+    def _ocr_profile() -> str:
+        """识别档位（环境变量 MEMEFINDER_OCR_PROFILE: fast/balanced/accurate，未设置时为 OCRProcessor.DEFAULT_PROFILE）"""
+        value = os.environ.get('MEMEFINDER_OCR_PROFILE', '').lower()
+        return value if value in OCRProcessor.PROFILES else OCRProcessor.DEFAULT_PROFILE
+    
+    @classmethod
+    def _ocr_batch_size(cls) -> int:
+        """每次送入OCR识别的最大图片数（环境变量 MEMEFINDER_OCR_BATCH_SIZE，默认8）"""
+        return cls._env_int('MEMEFINDER_OCR_BATCH_SIZE', 8)
+    
+    @staticmethod
+    def _env_int(name: str, default: int) -> int:
+        """读取正整数环境变量，未设置或无效时使用默认值"""
+        try:
+            return max(1, int(os.environ.get(name, default)))
+        except ValueError:
+            return default
+    
     def create_widgets(self):
         """创建界面组件"""
         # 顶部按钮区
@@ -67,6 +149,8 @@ class ProcessTab:
                   command=self.pause_processing).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="⏹️ 停止", 
                   command=self.stop_processing).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="🔁 重新识别不确定的图片", 
+                  command=self.requeue_ambiguous).pack(side=tk.LEFT, padx=5)
         
         # 进度信息
         progress_frame = ttk.LabelFrame(self.frame, text="处理进度", padding=10)
@@ -115,6 +199,35 @@ class ProcessTab:
         self.processing_thread.daemon = True
         self.processing_thread.start()
     
+    def requeue_ambiguous(self):
+        """用当前档位重新识别以较低档位识别、结果不确定（未识别到文本等）的图片"""
+        if self.processing:
+            messagebox.showinfo("提示", "正在处理中...")
+            return
+        
+        profiles = list(OCRProcessor.PROFILES)
+        lower = profiles[:profiles.index(self.ocr_profile)]
+        if not lower:
+            messagebox.showinfo("提示", f"当前识别档位为 {self.ocr_profile}，"
+                                      "请设置更精确的档位（MEMEFINDER_OCR_PROFILE）后重新启动程序")
+            return
+        
+        def _requeue():
+            try:
+                count = self.db.requeue_images(lower)
+            except Exception as e:
+                self.log_message(f"[错误] 重置图片失败: {e}")
+                return
+            if not count:
+                self.log_message("[INFO] 没有需要重新识别的图片")
+                return
+            self.log_message(f"[INFO] {count} 张以 {'/'.join(lower)} 档位识别、结果不确定的图片"
+                             f"将以 {self.ocr_profile} 档位重新识别（识别完成前不会出现在搜索结果中）")
+            self._ui(self.start_processing)
+        
+        # 分批更新，不阻塞界面
+        threading.Thread(target=_requeue, daemon=True).start()
+    
     def pause_processing(self):
         """暂停处理"""
         if self.processing:
@@ -135,71 +248,69 @@ class ProcessTab:
             except Exception:
                 pass
     
+    def shutdown(self):
+        """关闭程序前调用：停止处理、等待在途结果写入，然后停止OCR工作进程
+        
+        处理中被关闭时记为暂停，下次启动会提示继续。
+        """
+        was_processing = self.processing
+        self.processing = False
+        thread = self.processing_thread
+        if thread is not None and thread.is_alive():
+            thread.join(self.SHUTDOWN_TIMEOUT)
+        if was_processing:
+            try:
+                self.db.set_app_state('processing_state', 'paused')
+            except Exception:
+                pass
+        if isinstance(self.ocr_processor, OCRWorkerPool):
+            self.ocr_processor.shutdown()
+    
     def process_images_thread(self):
         """处理图片的线程"""
         try:
-            # 获取未处理的图片
-            unprocessed = self.db.get_unprocessed_images(limit=1000)
+            # 分批领取未处理的图片（带租约，多个处理者不会重复处理；崩溃后租约过期自动回收）
+            worker_id = self.db.new_worker_id()
+            total = self.db.get_images_count(processed=0)
             
-            if not unprocessed:
+            if not total:
                 self.log_message("[INFO] 没有待处理的图片")
                 self.processing = False
                 return
             
-            total = len(unprocessed)
-            self.log_message(f"[INFO] 开始处理 {total} 张图片...")
+            self.log_message(f"[INFO] 开始处理 {total} 张图片（识别档位: {self.ocr_profile}）...")
             
-            processed_count = 0
-            error_count = 0
+            # 已处理图片的感知哈希索引：相似图片（重新压缩/缩放的副本）直接复用识别结果
+            if self.reuse_similar:
+                self._similar_index = BKTree((phash, image_id)
+                                             for image_id, phash in self.db.iter_processed_phashes())
+            else:
+                self._similar_index = BKTree()
+            # 流水线中正在识别的图片：与其相似的图片等它完成后复用结果
+            self._pending_index = BKTree()
+            self._followers = {}   # 识别中的图片ID -> [(序号, ID, 感知哈希)]
+            self._inflight = set()  # 已领取、尚未完成的图片ID
+            self._state_lock = threading.Lock()
+            self._stats = [0, 0, 0]  # 成功, 复用, 失败
+            self._total = total
             
-            for idx, img_info in enumerate(unprocessed, 1):
-                if not self.processing:
-                    self.log_message("[暂停] 处理已暂停")
-                    break
-                
-                img_id = img_info['id']
-                img_path = img_info['file_path']
-                
-                try:
-                    # 更新进度
-                    progress = (idx / total) * 100
-                    self.progress_var.set(progress)
-                    self.progress_label.config(text=f"正在处理: {idx}/{total} - {Path(img_path).name}")
-                    
-                    self.log_message(f"[{idx}/{total}] 处理: {Path(img_path).name}")
-                    
-                    # 检查文件是否存在
-                    if not Path(img_path).exists():
-                        self.log_message(f"  [跳过] 文件不存在: {img_path}")
-                        error_count += 1
-                        continue
-                    
-                    # OCR识别和情绪分析
-                    result = self.ocr_processor.process_image(Path(img_path))
-                    
-                    # 更新数据库
-                    self.db.update_image_data(
-                        image_id=img_id,
-                        ocr_text=result['ocr_text'],
-                        filtered_text=result['filtered_text'],
-                        emotion=result['emotion'],
-                        pos_score=result['emotion_positive'],
-                        neg_score=result['emotion_negative']
-                    )
-                    
-                    # 日志输出
-                    if result['filtered_text']:
-                        self.log_message(f"  ✓ 识别文本: {result['filtered_text'][:50]}")
-                        self.log_message(f"  ✓ 情绪分类: {result['emotion']} (正:{result['emotion_positive']:.2f}, 负:{result['emotion_negative']:.2f})")
-                    else:
-                        self.log_message(f"  - 未识别到文本")
-                    
-                    processed_count += 1
-                    
-                except Exception as e:
-                    self.log_message(f"  [错误] {e}")
-                    error_count += 1
-                    continue
+            pipeline = Pipeline(self._build_stages())
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat_loop, args=(worker_id, stop_heartbeat),
+                                         name="process-heartbeat", daemon=True)
+            heartbeat.start()
+            try:
+                pipeline.run(self._claim_jobs(worker_id, total))
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+                # 流水线出错时尚未完成的图片立即释放，供下次或其他处理者领取
+                with self._state_lock:
+                    remaining = list(self._inflight)
+                    self._inflight.clear()
+                if remaining:
+                    self.db.release_images(worker_id, remaining)
+            processed_count, reused_count, error_count = self._stats
             
             # 完成
             self.processing = False
@@ -207,11 +318,13 @@ class ProcessTab:
                 self.db.set_app_state('processing_state', 'idle')
             except Exception:
                 pass
-            self.progress_var.set(100)
-            self.progress_label.config(text=f"处理完成: 成功 {processed_count}, 失败 {error_count}")
+            self._set_progress(100)
+            self._set_status(f"处理完成: 成功 {processed_count}, 失败 {error_count}")
             self.log_message("=" * 50)
             self.log_message(f"[完成] 处理结束")
             self.log_message(f"  成功: {processed_count} 张")
+            if reused_count:
+                self.log_message(f"  复用相似图片结果: {reused_count} 张")
             self.log_message(f"  失败: {error_count} 张")
             self.log_message("=" * 50)
             
@@ -225,8 +338,329 @@ class ProcessTab:
             import traceback
             self.log_message(traceback.format_exc())
     
+    # ==================== 处理流水线 ====================
+    # 领取/准备（本线程） → 解码外扩 → OCR识别 → 文本过滤和情绪分析 → 批量写入数据库，
+    # 各阶段由有界队列连接并同时运行；使用多进程识别时解码和文本处理在工作进程中完成
+    
+    def _build_stages(self) -> list:
+        """按识别方式组建流水线各阶段"""
+        queue_size = self._env_int('MEMEFINDER_PIPELINE_QUEUE', self.PIPELINE_QUEUE)
+        write_stage = Stage('write', self._write_stage, batch_size=self.WRITE_BATCH,
+                            queue_size=self.WRITE_BATCH)
+        
+        if isinstance(self.ocr_processor, OCRWorkerPool):
+            pool = self.ocr_processor
+            # 每个工作进程对应一个分发线程，一批识别完立即送下一批，不等待其他进程
+            return [
+                Stage('ocr', self._pool_ocr_stage, workers=pool.workers, batch_size=pool.batch_size,
+                      queue_size=pool.workers * pool.batch_size * queue_size),
+                write_stage,
+            ]
+        
+        batch_size = self.ocr_processor.batch_size
+        # PaddleOCR 推理不支持多线程同时调用，识别阶段只用一个线程
+        return [
+            Stage('decode', self._decode_stage,
+                  workers=self._env_int('MEMEFINDER_DECODE_THREADS', self.DECODE_THREADS),
+                  queue_size=batch_size * queue_size),
+            Stage('ocr', self._ocr_stage, batch_size=self.ocr_processor.current_batch_limit,
+                  queue_size=batch_size * queue_size),
+            Stage('text', self._text_stage,
+                  workers=self._env_int('MEMEFINDER_TEXT_THREADS', self.TEXT_THREADS),
+                  batch_size=batch_size, queue_size=batch_size * queue_size),
+            write_stage,
+        ]
+    
+    def _claim_jobs(self, worker_id: str, total: int):
+        """流水线数据源：分批领取图片，检查文件、复用相似图片的结果，其余图片送入流水线
+        
+        队列已满时在此阻塞，暂停后不再领取新图片，已进入流水线的图片处理完毕后结束。
+        """
+        idx = 0
+        while self.processing:
+            batch = self.db.claim_images(worker_id, limit=self.claim_batch)
+            if not batch:
+                break
+            with self._state_lock:
+                self._inflight.update(img['id'] for img in batch)
+            
+            for pos, img_info in enumerate(batch):
+                if not self.processing:
+                    # 未处理的图片立即释放，供下次或其他处理者领取
+                    ids = [img['id'] for img in batch[pos:]]
+                    with self._state_lock:
+                        self._inflight.difference_update(ids)
+                    self.db.release_images(worker_id, ids)
+                    self.log_message("[暂停] 处理已暂停")
+                    return
+                
+                idx += 1
+                job = self._prepare_job(img_info, idx, total)
+                if job is not None:
+                    yield job
+    
+    def _heartbeat_loop(self, worker_id: str, stop: threading.Event):
+        """续约线程：定期为所有已领取、尚未完成的图片续约，直到流水线结束
+        
+        不能放在领取循环中：队列已满时领取循环会阻塞，领取结束后也不再运行。
+        """
+        while not stop.wait(self.db.LEASE_SECONDS / 3):
+            with self._state_lock:
+                ids = list(self._inflight)
+            if not ids:
+                continue
+            try:
+                self.db.heartbeat(worker_id, ids)
+            except Exception as e:
+                self.log_message(f"[错误] 续约失败: {e}")
+    
+    def _prepare_job(self, img_info: dict, idx: int, total: int):
+        """检查文件、复用相似图片的结果；需要识别时返回流水线任务，否则返回 None"""
+        img_id = img_info['id']
+        img_path = img_info['file_path']
+        
+        try:
+            self._set_status(f"正在准备: {idx}/{total} - {Path(img_path).name}")
+            self.log_message(f"[{idx}/{total}] 处理: {Path(img_path).name}")
+            
+            # 检查文件是否存在
+            if not Path(img_path).exists():
+                self.log_message(f"  [跳过] 文件不存在: {img_path}")
+                self._finish(img_id, failed=True)
+                return None
+            
+            phash = None
+            if self.reuse_similar:
+                phash = img_info.get('phash')
+                if phash is None:
+                    phash = dhash(Path(img_path))
+                    if phash is not None:
+                        self.db.set_phash(img_id, phash)
+            detail = []  # 本图片的细节哈希（需要二次校验时才计算）
+            
+            # 查找已处理的相似图片（通过二次校验才复用）
+            with self._state_lock:
+                candidates = self._similar_index.search(phash) if phash is not None else []
+            for _, similar_id in candidates[:self.SIMILAR_CANDIDATES]:
+                if not self._verify_similar(img_path, detail, similar_id):
+                    continue
+                result = self.db.copy_image_result(similar_id, img_id)
+                if result is not None:
+                    self.log_message(f"  ✓ 复用相似图片的识别结果 (ID={similar_id})")
+                    self._finish(img_id, phash=phash, reused=True)
+                    return None
+            
+            # 与流水线中正在识别的图片相似：等其识别完成后复用结果
+            with self._state_lock:
+                leader_id = self._pending_index.nearest(phash) if phash is not None else None
+            if leader_id is not None and self._verify_similar(img_path, detail, leader_id):
+                with self._state_lock:
+                    if leader_id in self._followers:
+                        self._followers[leader_id].append((idx, img_id, phash))
+                        return None
+            
+            with self._state_lock:
+                if phash is not None:
+                    self._pending_index.add(phash, img_id)
+                self._followers[img_id] = []
+            
+            return {'idx': idx, 'id': img_id, 'path': Path(img_path), 'phash': phash}
+            
+        except Exception as e:
+            self.log_message(f"  [错误] {e}")
+            self._finish(img_id, failed=True)
+            return None
+    
+    def _verify_similar(self, img_path: str, detail: list, other_id: int) -> bool:
+        """二次校验感知哈希相近的图片是否为同一张图（宽高比和细节哈希，见 phash.same_image）
+        
+        同模板不同文字的表情包 64 位哈希可能几乎相同，不校验会复用到错误的文字。
+        detail 为本图片细节哈希的缓存（空列表表示尚未计算）。
+        """
+        other_path = self.db.get_image_path(other_id)
+        if other_path is None:
+            return False
+        if not detail:
+            detail.append(detail_hash(Path(img_path)))
+        return same_image(detail[0], detail_hash(Path(other_path)))
+    
+    def _decode_stage(self, jobs: list) -> list:
+        """解码并外扩画布（解码失败的图片按未识别到文本处理）"""
+        for job in jobs:
+            try:
+                job['canvas'], job['offset'], job['orig_wh'] = self.ocr_processor.decode_image(job['path'])
+            except Exception as e:
+                self.log_message(f"  [错误] 读取图片失败 {job['path'].name}: {e}")
+                job['items'] = []
+        return jobs
+    
+    def _ocr_stage(self, jobs: list) -> list:
+        """一次 predict 识别一批已解码的图片"""
+        todo = [job for job in jobs if 'canvas' in job]
+        if not todo:
+            return jobs
+        self._set_status(f"正在识别: {todo[0]['idx']}-{todo[-1]['idx']}/{self._total}（{len(todo)} 张）")
+        # 识别后立即释放画布，控制在途内存
+        entries = [(job['path'], job.pop('canvas'), job.pop('offset'), job.pop('orig_wh')) for job in todo]
+        try:
+            items_list = self.ocr_processor.recognize_batch(entries)
+        except Exception as e:
+            self.log_message(f"  [错误] 批量识别失败: {e}")
+            for job in todo:
+                job['error'] = e
+            return jobs
+        for job, items in zip(todo, items_list):
+            job['items'] = items
+        return jobs
+    
+    def _text_stage(self, jobs: list) -> list:
+        """提取文本、过滤、情绪分析"""
+        for job in jobs:
+            if 'error' in job:
+                continue
+            try:
+                job['result'] = self.ocr_processor.build_result(job.pop('items'))
+            except Exception as e:
+                job['error'] = e
+        return jobs
+    
+    def _pool_ocr_stage(self, jobs: list) -> list:
+        """交给工作进程识别（含文本过滤和情绪分析）"""
+        self._set_status(f"正在识别: {jobs[0]['idx']}-{jobs[-1]['idx']}/{self._total}（{len(jobs)} 张）")
+        try:
+            results = self.ocr_processor.process_batch([job['path'] for job in jobs])
+        except Exception as e:
+            self.log_message(f"  [错误] 批量识别失败: {e}")
+            results = [None] * len(jobs)
+            for job in jobs:
+                job['error'] = e
+        for job, result in zip(jobs, results):
+            if result is not None:
+                job['result'] = result
+        return jobs
+    
+    def _write_stage(self, jobs: list):
+        """写回一批识别结果（不逐条等待提交，由数据库写入线程合并为一个事务）"""
+        pending = []
+        for job in jobs:
+            if 'error' in job:
+                self._finish_job(job, None)
+                continue
+            result = job['result']
+            try:
+                future = self.db.update_image_data(
+                    image_id=job['id'],
+                    ocr_text=result['ocr_text'],
+                    filtered_text=result['filtered_text'],
+                    emotion=result['emotion'],
+                    pos_score=result['emotion_positive'],
+                    neg_score=result['emotion_negative'],
+                    profile=self.ocr_profile,
+                    wait=False
+                )
+            except Exception as e:
+                self.log_message(f"  [错误] {e}")
+                self._finish_job(job, None)
+                continue
+            pending.append((job, future))
+        
+        for job, future in pending:
+            try:
+                # 内容相同的其他图片同步获得结果
+                duplicates = future.result()
+            except Exception as e:
+                self.log_message(f"  [错误] {e}")
+                self._finish_job(job, None)
+                continue
+            self._finish_job(job, duplicates)
+    
+    def _finish_job(self, job: dict, duplicates):
+        """记录一张识别完成（duplicates 为 None 表示失败）的图片，并把结果复制给等待它的相似图片"""
+        idx, img_id = job['idx'], job['id']
+        total = self._total
+        self._set_progress(min(idx / total, 1.0) * 100)
+        with self._state_lock:
+            followers = self._followers.pop(img_id, [])
+        
+        if duplicates is None:
+            self._finish(img_id, failed=True)
+            for _, follower_id, _ in followers:
+                self.log_message(f"  [错误] 相似图片 (ID={img_id}) 识别失败: ID={follower_id}")
+                self._finish(follower_id, failed=True)
+            return
+        
+        result = job['result']
+        self.log_message(f"[{idx}/{total}] 完成: {job['path'].name}")
+        if result['filtered_text']:
+            self.log_message(f"  ✓ 识别文本: {result['filtered_text'][:50]}")
+            self.log_message(f"  ✓ 情绪分类: {result['emotion']} (正:{result['emotion_positive']:.2f}, 负:{result['emotion_negative']:.2f})")
+        else:
+            self.log_message(f"  - 未识别到文本")
+        if duplicates:
+            self.log_message(f"  ✓ 同步 {duplicates} 张相同内容的图片")
+        self._finish(img_id, phash=job['phash'])
+        
+        for follower_idx, follower_id, phash in followers:
+            try:
+                if self.db.copy_image_result(img_id, follower_id) is None:
+                    self.log_message(f"  [错误] 相似图片 (ID={img_id}) 识别失败: ID={follower_id}")
+                    self._finish(follower_id, failed=True)
+                    continue
+                self.log_message(f"[{follower_idx}/{total}] ✓ 复用相似图片的识别结果 (ID={img_id})")
+                self._finish(follower_id, phash=phash, reused=True)
+            except Exception as e:
+                self.log_message(f"  [错误] {e}")
+                self._finish(follower_id, failed=True)
+    
+    def _finish(self, img_id: int, phash: int = None, reused: bool = False, failed: bool = False):
+        """更新计数；成功的图片加入相似图片索引
+        
+        失败的图片不释放租约：同一轮中不会被再次领取，租约过期后由下次处理重试。
+        """
+        with self._state_lock:
+            self._inflight.discard(img_id)
+            if failed:
+                self._stats[2] += 1
+                return
+            if phash is not None:
+                self._similar_index.add(phash, img_id)
+            self._stats[0] += 1
+            if reused:
+                self._stats[1] += 1
+    
+    # ==================== 界面更新 ====================
+    # Tk 组件只能在界面线程中操作，后台线程通过 _ui() 提交更新
+    
+    def _ui(self, func, *args):
+        """在界面线程中执行 func(*args)（可在任意线程中调用）"""
+        self._ui_queue.put((func, args))
+    
+    def _poll_ui(self):
+        """界面线程：执行后台线程提交的界面更新"""
+        try:
+            for _ in range(self.UI_POLL_LIMIT):
+                try:
+                    func, args = self._ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                func(*args)
+        finally:
+            # 单个更新出错（由 Tk 报告）不影响之后的更新
+            self.frame.after(self.UI_POLL_MS, self._poll_ui)
+    
+    def _set_progress(self, percent: float):
+        """更新进度条（可在任意线程中调用）"""
+        self._ui(self.progress_var.set, percent)
+    
+    def _set_status(self, text: str):
+        """更新进度文字（可在任意线程中调用）"""
+        self._ui(lambda: self.progress_label.config(text=text))
+    
     def log_message(self, message: str):
-        """添加日志消息"""
+        """添加日志消息（可在任意线程中调用）"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self._ui(self._append_log, f"[{timestamp}] {message}\n")
+    
+    def _append_log(self, line: str):
+        self.log_text.insert(tk.END, line)
         self.log_text.see(tk.END)
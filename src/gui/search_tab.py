@@ -58,6 +58,10 @@ class SearchTab:
         ttk.Button(search_frame, text="🔍 搜索", 
                   command=self.search_images).grid(row=0, column=4, padx=10)
         
+        # 结果数量及情绪分布
+        self.facet_label = ttk.Label(search_frame, text="")
+        self.facet_label.grid(row=1, column=0, columnspan=5, sticky=tk.W, padx=5)
+        
         # 结果列表
         result_frame = ttk.LabelFrame(self.frame, text="搜索结果", padding=10)
         result_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -156,15 +160,17 @@ class SearchTab:
         self.image_refs.clear()
         self.item_paths.clear()
 
-        # 计算总页数
-        total = self.db.get_images_count(processed=1, keyword=keyword, emotion=emotion)
-        self.total_pages = max(1, (total + page_size - 1) // page_size)
-        if page > self.total_pages:
-            page = self.total_pages
+        # 一次获取这一页的数据、总数和情绪分布
+        data = self.db.search_page(page=page, page_size=page_size, processed=1, keyword=keyword, emotion=emotion)
+        results = data['results']
+        self.total_pages = data['total_pages']
+        if page != data['page']:
+            page = data['page']
             self.page_var.set(page)
-
-        # 获取这一页的数据
-        results = self.db.get_images_page(page=page, page_size=page_size, processed=1, keyword=keyword, emotion=emotion)
+        
+        facets = " | ".join(f"{name or '未分类'}: {count}"
+                            for name, count in sorted(data['facets'].items(), key=lambda item: -item[1]))
+        self.facet_label.config(text=f"共 {data['total']} 张" + (f"（{facets}）" if facets else ""))
 
         # 根据画布宽度和缩略图尺寸动态计算每行列数
         try:
@@ -5,12 +5,15 @@
 """
 
 import os
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from datetime import datetime
 
 from ..core.database import ImageDatabase
-from ..core.scanner import ImageScanner
+from ..core.scanner import ImageScanner, FingerprintIndex, HashStats
+from ..core.ingest import SCAN_LOCK, ingest_source
+from ..core.watcher import SourceWatcher
 
 
 class SourceTab:
@@ -21,9 +24,39 @@ class SourceTab:
         self.db = db
         self.scanner = ImageScanner()
         
+        # 扫描状态（后台线程写入，界面线程通过 after() 轮询读取）
+        self.scanning = False
+        self.scan_thread = None
+        self._scan_cancel = threading.Event()
+        self._scan_stats = HashStats()
+        self._scan_state = {}
+        
+        # 实时监控（监控线程只设置标志，界面线程轮询刷新）
+        self.watcher = None
+        self._watch_changed = False
+        
+        # 后台删除图源（删除线程写入进度，界面线程轮询读取）
+        self._remove_state = None
+        
         # 创建主框架
         self.frame = ttk.Frame(parent)
         self.create_widgets()
+        
+        # 恢复上次的实时监控设置
+        try:
+            if self.db.get_app_state('watch_enabled') == '1':
+                self.watch_var.set(True)
+                self.toggle_watch()
+        except Exception:
+            pass
+        
+        # 继续删除上次未删除完成的图源
+        try:
+            pending = self.db.get_removing_sources()
+            if pending:
+                self._start_removal(pending, notify=False)
+        except Exception:
+            pass
     
     def create_widgets(self):
         """创建界面组件"""
@@ -37,8 +70,13 @@ class SourceTab:
                   command=self.remove_source).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="🔄 刷新列表", 
                   command=self.refresh_sources).pack(side=tk.LEFT, padx=5)
-        ttk.Button(btn_frame, text="🔍 扫描新图片", 
-                  command=self.scan_sources).pack(side=tk.LEFT, padx=5)
+        self.scan_btn = ttk.Button(btn_frame, text="🔍 扫描新图片", 
+                                   command=self.scan_sources)
+        self.scan_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="👁️ 实时监控", variable=self.watch_var,
+                        command=self.toggle_watch).pack(side=tk.LEFT, padx=5)
         
         # 图源列表
         list_frame = ttk.Frame(self.frame)
@@ -75,6 +113,20 @@ class SourceTab:
         
         self.source_tree.bind("<Button-3>", self.show_source_menu)
         
+        # 扫描进度区
+        progress_frame = ttk.LabelFrame(self.frame, text="扫描进度", padding=10)
+        progress_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.scan_progress_var = tk.DoubleVar()
+        ttk.Progressbar(progress_frame, variable=self.scan_progress_var,
+                        maximum=100, mode='determinate').pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.cancel_btn = ttk.Button(progress_frame, text="⏹️ 取消扫描",
+                                     command=self.cancel_scan, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5)
+        
+        self.scan_progress_text = tk.StringVar(value="未在扫描")
+        ttk.Label(self.frame, textvariable=self.scan_progress_text).pack(fill=tk.X, padx=15)
+        
         # 统计信息区
         stats_frame = ttk.LabelFrame(self.frame, text="统计信息", padding=10)
         stats_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -108,6 +160,7 @@ class SourceTab:
 
             if self.db.add_source(folder):
                 messagebox.showinfo("成功", f"已添加图源：{folder}")
+                self._refresh_watcher()
                 self.refresh_sources()
                 self.update_statistics()
             else:
@@ -120,12 +173,81 @@ class SourceTab:
             messagebox.showwarning("警告", "请先选择要删除的图源")
             return
         
+        if self._remove_state is not None:
+            messagebox.showinfo("提示", "正在删除图源，请稍候...")
+            return
+        
         if messagebox.askyesno("确认", "确定要删除选中的图源吗？\n这将同时删除该图源的所有图片记录。"):
-            for item in selected:
-                source_id = int(self.source_tree.item(item)['text'])
-                self.db.remove_source(source_id)
+            source_ids = [int(self.source_tree.item(item)['text']) for item in selected]
+            self._start_removal(source_ids)
+    
+    def _start_removal(self, source_ids, notify: bool = True):
+        """在后台线程中分批删除图源的图片记录，界面保持可用"""
+        state = {
+            'count': len(source_ids),
+            'index': 0,
+            'deleted': 0,
+            'total': 0,
+            'marked': False,
+            'notify': notify,
+            'done': False,
+            'error': None,
+        }
+        self._remove_state = state
+        thread = threading.Thread(target=self._remove_thread, args=(source_ids, state))
+        thread.daemon = True
+        thread.start()
+        self.frame.after(200, self._poll_removal)
+    
+    def _remove_thread(self, source_ids, state: dict):
+        """删除线程：不直接访问界面"""
+        try:
+            for index, source_id in enumerate(source_ids):
+                state['index'] = index
+                
+                def _progress(deleted: int, total: int):
+                    state['deleted'] = deleted
+                    state['total'] = total
+                    state['marked'] = True
+                
+                # 等待正在进行的入库完成，避免删除期间又写入该图源的图片
+                with SCAN_LOCK:
+                    self.db.remove_source(source_id, on_progress=_progress)
+        except Exception as e:
+            state['error'] = str(e)
+        finally:
+            state['done'] = True
+    
+    def _poll_removal(self):
+        """在界面线程中刷新删除进度"""
+        state = self._remove_state
+        if state['marked']:
+            # 已标记为删除中的图源不再显示
+            state['marked'] = False
+            self._refresh_watcher()
             self.refresh_sources()
-            self.update_statistics()
+        if not self.scanning:
+            self.scan_progress_text.set(
+                f"[{state['index'] + 1}/{state['count']}] 正在删除图源记录: "
+                f"{state['deleted']}/{state['total']}"
+            )
+        
+        if not state['done']:
+            self.frame.after(200, self._poll_removal)
+            return
+        
+        self._remove_state = None
+        self._refresh_watcher()
+        self.refresh_sources()
+        self.update_statistics()
+        if state['error']:
+            if not self.scanning:
+                self.scan_progress_text.set("删除图源出错")
+            messagebox.showerror("错误", f"删除图源失败: {state['error']}\n下次启动时会继续删除。")
+            return
+        if not self.scanning:
+            self.scan_progress_text.set("图源已删除")
+        if state['notify']:
             messagebox.showinfo("成功", "已删除选中的图源")
     
     def refresh_sources(self):
@@ -172,10 +294,15 @@ class SourceTab:
             status = self.source_tree.item(item)['values'][3]
             enabled = "✗" in status
             self.db.toggle_source(source_id, enabled)
+            self._refresh_watcher()
             self.refresh_sources()
     
     def scan_sources(self):
-        """扫描图源中的新图片"""
+        """扫描图源中的新图片（在后台线程中执行）"""
+        if self.scanning:
+            messagebox.showinfo("提示", "正在扫描中...")
+            return
+        
         sources = self.db.get_sources()
         enabled_sources = [s for s in sources if s['enabled']]
         
@@ -183,28 +310,141 @@ class SourceTab:
             messagebox.showwarning("警告", "没有启用的图源")
             return
         
-        total_new = 0
-        for source in enabled_sources:
-            folder_path = source['folder_path']
-            if not os.path.exists(folder_path):
-                continue
-            
-            # 获取已存在的图片哈希
-            existing_hashes = self.db.get_image_hashes(source['id'])
-            
-            # 查找新图片
-            new_images = self.scanner.find_new_images(folder_path, existing_hashes)
+        # 标记扫描状态（用于断点恢复）
+        try:
+            self.db.set_app_state('scan_state', 'running')
+        except Exception:
+            pass
+        
+        self.scanning = True
+        self._scan_cancel.clear()
+        self._scan_stats = HashStats()
+        self._scan_state = {
+            'index': 0,
+            'count': len(enabled_sources),
+            'folder': '',
+            'new': 0,
+            'done': False,
+            'cancelled': False,
+            'error': None,
+        }
+        self.scan_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.scan_progress_var.set(0)
+        
+        self.scan_thread = threading.Thread(target=self._scan_thread,
+                                            args=(enabled_sources, self._scan_cancel,
+                                                  self._scan_stats, self._scan_state))
+        self.scan_thread.daemon = True
+        self.scan_thread.start()
+        self.frame.after(200, self._poll_scan)
+    
+    def cancel_scan(self):
+        """取消扫描（已处理的部分会保留，下次扫描从中断处继续）"""
+        if self.scanning:
+            self._scan_cancel.set()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.scan_progress_text.set("正在取消，等待已读取的文件处理完成...")
+    
+    def _scan_thread(self, sources, cancel: threading.Event, hash_stats: HashStats, state: dict):
+        """扫描线程：遍历、计算哈希并分批写入数据库，不直接访问界面"""
+        try:
+            # 加载全局指纹索引（旧版本数据库中的图片由 ingest_source 补充快速指纹）
+            fingerprints = FingerprintIndex(self.db.get_quick_fingerprints())
             
-            # 添加到数据库
-            for img_path, img_hash in new_images:
-                self.db.add_image(str(img_path), img_hash, source['id'])
-                total_new += 1
+            for index, source in enumerate(sources):
+                if cancel.is_set():
+                    break
+                folder_path = source['folder_path']
+                state['index'] = index
+                state['folder'] = folder_path
+                if not os.path.exists(folder_path):
+                    continue
+                
+                new_before = state['new']
+                
+                def _progress(added: int):
+                    state['new'] = new_before + added
+                
+                ingest_source(self.db, source['id'], folder_path, fingerprints,
+                              stats=hash_stats, cancel=cancel, on_progress=_progress)
             
-            self.db.update_scan_time(source['id'])
+            state['cancelled'] = cancel.is_set()
+            if not state['cancelled']:
+                # 完整扫描后顺便校验统计计数器（需要扫描整张表，在后台线程中进行）
+                self.db.check_statistics()
+            self.db.set_app_state('scan_state', 'idle')
+        except Exception as e:
+            state['error'] = str(e)
+        finally:
+            state['done'] = True
+    
+    def shutdown(self, timeout: float = 10.0):
+        """关闭程序前调用：停止实时监控，取消正在进行的扫描并等待已读取的部分写入
+        
+        被中断的扫描保持为进行中，下次启动会提示继续。
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        thread = self.scan_thread
+        if self.scanning and thread is not None:
+            self._scan_cancel.set()
+            thread.join(timeout)
+            try:
+                self.db.set_app_state('scan_state', 'running')
+            except Exception:
+                pass
+    
+    def _poll_scan(self):
+        """在界面线程中刷新扫描进度"""
+        state = self._scan_state
+        stats = self._scan_stats
+        
+        count = max(1, state['count'])
+        self.scan_progress_var.set(state['index'] * 100 / count)
+        if not self._scan_cancel.is_set():
+            self.scan_progress_text.set(
+                f"[{state['index'] + 1}/{count}] {state['folder']} | "
+                f"目录: {stats.dirs} | 文件: {stats.seen_files} | "
+                f"读取: {stats.bytes / 1024 / 1024:.1f} MB | 新图片: {state['new']}"
+            )
+        
+        if state['done']:
+            self._finish_scan()
+        else:
+            self.frame.after(200, self._poll_scan)
+    
+    def _finish_scan(self):
+        """扫描线程结束后的界面处理"""
+        state = self._scan_state
+        hash_stats = self._scan_stats
+        total_new = state['new']
+        
+        self.scanning = False
+        self.scan_thread = None
+        self.scan_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.scan_progress_var.set(0 if state['cancelled'] or state['error'] else 100)
         
         self.refresh_sources()
         self.update_statistics()
-        messagebox.showinfo("完成", f"扫描完成！\n发现新图片: {total_new} 张")
+        
+        if state['error']:
+            self.scan_progress_text.set("扫描出错")
+            messagebox.showerror("错误", f"扫描失败: {state['error']}\n已扫描的部分已保存，重新扫描会从中断处继续。")
+            return
+        
+        if state['cancelled']:
+            self.scan_progress_text.set(f"扫描已取消，已发现新图片: {total_new} 张")
+            messagebox.showinfo("已取消", f"扫描已取消\n已发现新图片: {total_new} 张\n"
+                                          f"已扫描的部分已保存，重新扫描会从中断处继续。")
+            return
+        
+        self.scan_progress_text.set(f"扫描完成，发现新图片: {total_new} 张")
+        message = f"扫描完成！\n发现新图片: {total_new} 张"
+        if hash_stats.files:
+            message += f"\n计算哈希: {hash_stats.summary()}"
+        messagebox.showinfo("完成", message)
 
         # 仅在发现新图片时自动切换到图片处理标签页
         if total_new > 0:
@@ -221,6 +461,45 @@ class SourceTab:
                 # 忽略切换错误，不影响扫描结果
                 pass
     
+    def toggle_watch(self):
+        """开启/关闭实时监控"""
+        if self.watch_var.get():
+            if self.watcher is None:
+                self.watcher = SourceWatcher(self.db, on_change=self._on_watch_change)
+            self.watcher.start()
+            self.frame.after(1000, self._poll_watch)
+            self.scan_progress_text.set(f"实时监控已开启（{'文件系统事件' if self.watcher.mode == 'watchdog' else '定时增量扫描'}）")
+        elif self.watcher is not None:
+            self.watcher.stop()
+            self.scan_progress_text.set("实时监控已关闭")
+        
+        try:
+            self.db.set_app_state('watch_enabled', '1' if self.watch_var.get() else '0')
+        except Exception:
+            pass
+    
+    def _refresh_watcher(self):
+        """图源变化后更新监控目录"""
+        if self.watcher is not None and self.watcher.running:
+            try:
+                self.watcher.refresh_sources()
+            except Exception:
+                pass
+    
+    def _on_watch_change(self, changed: int):
+        """监控线程回调：只设置标志，由界面线程刷新"""
+        self._watch_changed = True
+    
+    def _poll_watch(self):
+        """在界面线程中响应监控到的变化"""
+        if self.watcher is None or not self.watcher.running:
+            return
+        if self._watch_changed and not self.scanning:
+            self._watch_changed = False
+            self.refresh_sources()
+            self.update_statistics()
+        self.frame.after(1000, self._poll_watch)
+    
     def update_statistics(self):
         """更新统计信息"""
         stats = self.db.get_statistics()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+查询计划回归测试 - 查询或索引修改后出现全表扫描、临时排序或关键词 LIKE 匹配时失败
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from core.database import ImageDatabase
+
+
+EMOTIONS = ["积极", "消极", "中性", "未分类"]
+TEXTS = ["测试文字", "今天天气很好", "你好世界", "哈哈", "", "加油"]
+PROFILES = ["fast", "balanced", "accurate"]
+
+
+@pytest.fixture
+def db(tmp_path):
+    """有代表性数据的数据库：两个图源、已处理/未处理的图片、文件状态清单"""
+    database = ImageDatabase(str(tmp_path / "plan_check.db"))
+    for name in ("a", "b"):
+        folder = tmp_path / name
+        folder.mkdir()
+        database.add_source(str(folder))
+    
+    sources = database.get_sources()
+    rows = []
+    for i in range(400):
+        source = sources[i % len(sources)]
+        file_path = str(Path(source['folder_path']) / f"img{i}.png")
+        rows.append((file_path, f"hash{i % 350}", source['id'], 1000 + i, f"quick{i % 350}"))
+    database.add_images_batch(rows)
+    
+    for image_id in range(1, 301):
+        text = TEXTS[image_id % len(TEXTS)]
+        database.update_image_data(image_id, text, text, EMOTIONS[image_id % len(EMOTIONS)], 0.5, 0.5,
+                                   profile=PROFILES[image_id % len(PROFILES)])
+    
+    for source in sources:
+        entries = [(row[0], row[3], 0, i, row[1]) for i, row in enumerate(rows) if row[2] == source['id']]
+        database.save_file_manifest(source['id'], entries)
+        database.save_dir_mtimes(source['id'], [(source['folder_path'], 0)])
+    database.flush()
+    
+    yield database
+    database.close()
+
+
+def test_query_plans_use_indexes(db):
+    assert db.verify_query_plans() == []